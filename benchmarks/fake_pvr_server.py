@@ -0,0 +1,165 @@
+"""Local stand-in for the PVR csessions API and the Telegram Bot API.
+
+Serves realistic cinemaMovieSessions payloads with configurable size, latency,
+error rate and a "booking opens at T" moment per (cid, dated) target. Once open,
+seats sell at --sell-rate so seat availability moves between polls. Every
+upstream request and every Telegram message is recorded and exposed on
+/_stats so the benchmark driver can compute request volume and detection latency.
+
+    python benchmarks/fake_pvr_server.py --port 8900 --films 12 --shows-per-film 8
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+SHOW_TIMES = ["09:15 AM", "10:30 AM", "11:45 AM", "01:00 PM", "02:20 PM", "03:40 PM",
+              "05:00 PM", "06:15 PM", "07:30 PM", "08:45 PM", "10:00 PM", "11:15 PM"]
+EXPERIENCES = ["2D", "IMAX 2D", "4DX", "PLAYHOUSE"]
+
+
+class FakePVR:
+    def __init__(self, films, shows_per_film, latency_ms, error_rate, open_after, open_spread, sell_rate=0.0):
+        self.films = films
+        self.shows_per_film = shows_per_film
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.open_after = open_after
+        self.open_spread = open_spread
+        self.sell_rate = sell_rate
+        self.started = time.time()
+        self.opens_at = {}        # (cid, dated) -> wall-clock time bookings open
+        self.requests = {}        # (cid, dated) -> request count
+        self.errors = 0
+        self.telegram = []        # (received_at, chat_id, text)
+        self._payloads = {}       # (cid, dated) -> sessions served once open
+
+    def open_time(self, key):
+        if key not in self.opens_at:
+            self.opens_at[key] = self.started + self.open_after + random.uniform(0, self.open_spread)
+        return self.opens_at[key]
+
+    def build_sessions(self, cid, dated):
+        sessions = []
+        for film in range(self.films):
+            experiences = []
+            for exp_index, experience in enumerate(EXPERIENCES[:2]):
+                shows = []
+                for show_index in range(self.shows_per_film):
+                    total = random.choice([120, 180, 240, 300])
+                    shows.append({
+                        "sessionId": f"{cid}-{dated}-{film}-{exp_index}-{show_index}",
+                        "showTime": SHOW_TIMES[(film + show_index) % len(SHOW_TIMES)],
+                        "screenName": f"AUDI {(show_index % 10) + 1:02d}",
+                        "subtitle": show_index % 3 == 0,
+                        "ss": 1,
+                        "availableSeats": random.randint(0, total),
+                        "totalSeats": total,
+                        "experience": experience,
+                    })
+                experiences.append({"experienceKey": experience, "shows": shows})
+            sessions.append({
+                "movieRe": {
+                    "filmName": f"Benchmark Film {film:02d}",
+                    "filmCommonId": f"F{film:04d}",
+                    "language": "TAMIL" if film % 2 else "ENGLISH",
+                    "certificate": "UA",
+                    "duration": "150 mins",
+                },
+                "experienceSessions": experiences,
+            })
+        return sessions
+
+    async def csessions(self, request):
+        body = await request.json()
+        key = (str(body.get("cid")), body.get("dated"))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if self.latency_ms:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency_ms / 1000)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": "upstream unavailable"}, status=random.choice([500, 502, 503]))
+
+        if time.time() < self.open_time(key):
+            sessions = []
+        else:
+            if key not in self._payloads:
+                self._payloads[key] = self.build_sessions(*key)
+            sessions = self._payloads[key]
+            if self.sell_rate:
+                self.sell_seats(sessions)
+        return web.json_response({"output": {"cinemaMovieSessions": sessions}})
+
+    def sell_seats(self, sessions):
+        """Sell a few seats from a sell_rate fraction of shows; occasionally a sold-out show gets returns"""
+        for session in sessions:
+            for experience in session["experienceSessions"]:
+                for show in experience["shows"]:
+                    if random.random() >= self.sell_rate:
+                        continue
+                    if show["availableSeats"] == 0 and random.random() < 0.2:
+                        show["availableSeats"] = random.randint(1, 4)
+                    else:
+                        show["availableSeats"] = max(show["availableSeats"] - random.randint(1, 12), 0)
+
+    async def send_message(self, request):
+        body = await request.json()
+        self.telegram.append((time.time(), body.get("chat_id"), body.get("text", "")))
+        return web.json_response({"ok": True, "result": {"message_id": len(self.telegram)}})
+
+    async def get_me(self, request):
+        return web.json_response({"ok": True, "result": {"username": "fake_pvr_bot", "first_name": "Fake"}})
+
+    async def stats(self, request):
+        return web.json_response({
+            "opens_at": [[cid, dated, at] for (cid, dated), at in self.opens_at.items()],
+            "requests": [[cid, dated, count] for (cid, dated), count in self.requests.items()],
+            "errors": self.errors,
+            "telegram": self.telegram,
+        })
+
+    async def reset(self, request):
+        body = await request.json() if request.can_read_body else {}
+        self.started = time.time()
+        self.open_after = body.get("open_after", self.open_after)
+        self.error_rate = body.get("error_rate", self.error_rate)
+        self.sell_rate = body.get("sell_rate", self.sell_rate)
+        self.opens_at.clear()
+        self.requests.clear()
+        self.telegram.clear()
+        self._payloads.clear()
+        self.errors = 0
+        return web.json_response({"ok": True})
+
+
+def build_app(fake):
+    app = web.Application()
+    app.router.add_post("/api/v1/booking/content/csessions", fake.csessions)
+    app.router.add_post("/bot{token}/sendMessage", fake.send_message)
+    app.router.add_get("/bot{token}/getMe", fake.get_me)
+    app.router.add_get("/_stats", fake.stats)
+    app.router.add_post("/_reset", fake.reset)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--films", type=int, default=12, help="films per csessions response")
+    parser.add_argument("--shows-per-film", type=int, default=8, help="shows per film per experience")
+    parser.add_argument("--latency-ms", type=float, default=80, help="mean csessions response latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of csessions calls that return 5xx")
+    parser.add_argument("--sell-rate", type=float, default=0.0, help="fraction of shows selling seats on each request once open")
+    parser.add_argument("--open-after", type=float, default=5, help="seconds after start (or /_reset) that bookings open")
+    parser.add_argument("--open-spread", type=float, default=3, help="random spread of opening times across targets")
+    args = parser.parse_args()
+
+    fake = FakePVR(args.films, args.shows_per_film, args.latency_ms, args.error_rate, args.open_after, args.open_spread, args.sell_rate)
+    web.run_app(build_app(fake), host=args.host, port=args.port, print=None, access_log=None, shutdown_timeout=1)
+
+
+if __name__ == "__main__":
+    main()
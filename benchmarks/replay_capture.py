@@ -0,0 +1,78 @@
+"""Replay a recorded csessions capture through pvr_monitor's parse, diff and alert path.
+
+Record traffic by running pvr_monitor (or run_benchmarks.py --capture-dir) with
+CAPTURE_DIR set, then:
+
+    python benchmarks/replay_capture.py captures/ --output replay.json
+    python benchmarks/replay_capture.py captures/ --expect replay.json
+
+Nothing is sent or persisted: alerts are collected and summarised with a
+digest, so --expect can tell whether a change altered them. The report
+includes per-payload cost for each stage and the speedup over the recorded
+timeline.
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_monitor():
+    """Import pvr_monitor as an isolated replay process: no boot, store, catalog refresh or capture"""
+    os.environ.update({
+        "PVR_ROLE": "replay",
+        "WATCH_DB_PATH": "",
+        "CATALOG_PATH": os.environ.get("CATALOG_PATH", ""),
+        "CATALOG_TTL": "0",
+        "CAPTURE_DIR": "",
+    })
+    sys.path.insert(0, ROOT)
+    import logging
+    import pvr_monitor
+    logging.getLogger().setLevel(logging.WARNING)
+    return pvr_monitor
+
+
+def compare_alerts(report, expected):
+    """Alert messages only in one of the two runs"""
+    ours = [tuple(alert) for alert in report["alert_messages"]]
+    theirs = [tuple(alert) for alert in expected["alert_messages"]]
+    return {
+        "same": report["alerts_digest"] == expected["alerts_digest"],
+        "missing": [alert for alert in theirs if alert not in ours],
+        "unexpected": [alert for alert in ours if alert not in theirs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="capture directory or a single .seg file")
+    parser.add_argument("--watches", help="JSON list of watch payloads (as POSTed to /watches); default one unfiltered watch per target")
+    parser.add_argument("--speed", type=float, default=0, help="replay at this multiple of real time; 0 is as fast as possible")
+    parser.add_argument("--expect", help="earlier replay report whose alerts should be reproduced")
+    parser.add_argument("--output", help="write the report JSON here")
+    args = parser.parse_args()
+
+    watches = None
+    if args.watches:
+        with open(args.watches) as handle:
+            watches = json.load(handle)
+    monitor = load_monitor()
+    report = monitor.CaptureReplay(args.source, watches, args.speed).run()
+
+    summary = {key: value for key, value in report.items() if key != "alert_messages"}
+    if args.expect:
+        with open(args.expect) as handle:
+            summary["comparison"] = compare_alerts(report, json.load(handle))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2, ensure_ascii=False)
+    if args.expect and not summary["comparison"]["same"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Offline benchmark suite for pvr_monitor against benchmarks/fake_pvr_server.py.
+
+Starts the fake PVR/Telegram server in a subprocess, points pvr_monitor at it and
+measures:
+
+  * check_booking latency and csessions polls/sec through the polling engine
+  * csessions parsing cost per payload (time and retained memory), with and
+    without a film filter, for a large multiplex-sized response
+  * /start_monitoring at scale: detection latency from "booking opens" to the
+    Telegram alert, upstream requests per watch, CPU seconds and RSS per watch
+
+Results are written as JSON so runs can be compared across releases:
+
+    python benchmarks/run_benchmarks.py --watches 200 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALERT_PATTERN = re.compile(r"Date:</b> (\d{4}-\d{2}-\d{2})<br><b>🏢 PVR:</b> ([^<]+?), Chennai")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http_json(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=10) as res:
+        return json.loads(res.read())
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index], 2)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_server(args, port):
+    cmd = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_pvr_server.py"),
+        "--port", str(port),
+        "--films", str(args.films),
+        "--shows-per-film", str(args.shows_per_film),
+        "--latency-ms", str(args.latency_ms),
+        "--error-rate", str(args.error_rate),
+        "--open-after", str(args.open_after),
+        "--open-spread", str(args.open_spread),
+        "--sell-rate", str(getattr(args, "sell_rate", 0.0)),
+    ]
+    proc = subprocess.Popen(cmd)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            http_json(f"{base}/_stats")
+            return proc, base
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake PVR server did not start")
+
+
+def configure_monitor(args, base):
+    """Point pvr_monitor at the fake server and import it"""
+    os.environ.update({
+        "PVR_SESSIONS_URL": f"{base}/api/v1/booking/content/csessions",
+        "TELEGRAM_API_BASE": base,
+        "BOT_TOKEN": "bench",
+        "CHAT_ID": "bench",
+        "WATCH_DB_PATH": "",
+        "CATALOG_PATH": "",
+        "CATALOG_TTL": "0",
+        "CHECK_INTERVAL": str(args.check_interval),
+        "MIN_CHECK_INTERVAL": str(min(args.check_interval / 4, 1)),
+        "POLL_STAGGER": str(min(args.check_interval, 5)),
+        "ALERT_MERGE_WINDOW": "0.5",
+        "PVR_REQUEST_RATE": str(args.request_rate),
+        "PVR_REQUEST_BURST": str(max(int(args.request_rate), 1)),
+        "CAPTURE_DIR": args.capture_dir or "",
+    })
+    sys.path.insert(0, ROOT)
+    import logging
+    import pvr_monitor
+    logging.getLogger().setLevel(logging.WARNING)
+    return pvr_monitor
+
+
+def bench_check_booking(monitor, args):
+    dates = [(datetime.date.today() + datetime.timedelta(days=offset)).isoformat() for offset in range(1, 8)]
+    cinema_ids = list(monitor.CINEMA_CODES.values())
+
+    # Sequential latency with the shared cache bypassed
+    ttl = monitor.sessions_cache.ttl
+    monitor.sessions_cache.ttl = 0
+    latencies = []
+    failed = 0
+    for i in range(args.latency_samples):
+        start = time.perf_counter()
+        try:
+            monitor.check_booking(cinema_ids[i % len(cinema_ids)], dates[0])
+        except (monitor.FetchFailed, monitor.UpstreamUnavailable):
+            failed += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Throughput: every distinct (cid, dated) target at once through the engine
+    async def poll_all():
+        import asyncio
+        await asyncio.gather(*[monitor.fetch_sessions(cid, dated) for cid in cinema_ids for dated in dates], return_exceptions=True)
+
+    start = time.perf_counter()
+    rounds = args.throughput_rounds
+    for _ in range(rounds):
+        monitor.engine.run(poll_all())
+    elapsed = time.perf_counter() - start
+    monitor.sessions_cache.ttl = ttl
+
+    return {
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "polls_per_sec": round(rounds * len(cinema_ids) * len(dates) / elapsed, 1),
+        "failed_lookups": failed,
+        "concurrency_limit": monitor.MAX_CONCURRENT_REQUESTS,
+    }
+
+
+def bench_parsing(monitor, args):
+    sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+    from fake_pvr_server import FakePVR
+
+    fake = FakePVR(args.parse_films, args.shows_per_film, 0, 0, 0, 0)
+    body = json.dumps({"output": {"cinemaMovieSessions": fake.build_sessions("320", "2030-01-01")}}).encode()
+    film = "Benchmark Film 03"
+    results = {"payload_kb": round(len(body) / 1024, 1)}
+    for label, film_wanted in (("all_films", None), ("one_film", lambda name: name == film)):
+        def parse_once():
+            snapshot = monitor.ShowSnapshot()
+            snapshot.diff(monitor.parse_sessions(body, film_wanted))
+            return snapshot
+
+        parse_once()
+        start = time.perf_counter()
+        for _ in range(args.parse_rounds):
+            parse_once()
+        results[f"{label}_ms"] = round((time.perf_counter() - start) / args.parse_rounds * 1000, 3)
+        tracemalloc.start()
+        snapshot = parse_once()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del snapshot
+        results[f"{label}_retained_kb"] = round(retained / 1024, 1)
+        results[f"{label}_peak_kb"] = round(peak / 1024, 1)
+    return results
+
+
+def bench_monitoring(monitor, args, base):
+    http_json(f"{base}/_reset", {"open_after": args.open_after})
+    client = monitor.app.test_client()
+    cinemas = list(monitor.CINEMA_CODES)
+    dates = [(datetime.date.today() + datetime.timedelta(days=offset)).isoformat() for offset in range(1, args.dates + 1)]
+
+    rss_before = rss_kb()
+    cpu_before = time.process_time()
+    started = time.time()
+    expected = 0
+    for i in range(args.watches):
+        payload = {
+            "cinemas": [cinemas[i % len(cinemas)], cinemas[(i * 7 + 3) % len(cinemas)]],
+            "date": dates[(i // len(cinemas)) % len(dates)],
+            "chat_id": f"bench-{i}",
+        }
+        expected += len(set(payload["cinemas"]))
+        if i % 2:
+            payload["film_name"] = f"Benchmark Film {i % args.films:02d}"
+        res = client.post("/start_monitoring", json=payload)
+        if res.status_code != 200:
+            raise RuntimeError(f"/start_monitoring failed: {res.json}")
+    setup_seconds = time.time() - started
+
+    time.sleep(args.duration)
+    elapsed = time.time() - started
+    cpu_used = time.process_time() - cpu_before
+    rss_after = rss_kb()
+    stats = http_json(f"{base}/_stats")
+    client.post("/stop_monitoring")
+
+    opens_at = {(cid, dated): at for cid, dated, at in stats["opens_at"]}
+    upstream_requests = sum(count for _, _, count in stats["requests"])
+    first_alert = {}  # (chat_id, cid, dated) -> first alert time
+    alerts = 0
+    for received_at, chat_id, text in stats["telegram"]:
+        for dated, cinema in ALERT_PATTERN.findall(text):
+            alerts += 1
+            key = (chat_id, monitor.CINEMA_CODES.get(cinema), dated)
+            first_alert.setdefault(key, received_at)
+    latencies = [(at - opens_at[(cid, dated)]) * 1000 for (_, cid, dated), at in first_alert.items() if (cid, dated) in opens_at]
+
+    return {
+        "watches": args.watches,
+        "targets": len(stats["requests"]),
+        "duration_sec": round(elapsed, 1),
+        "setup_sec": round(setup_seconds, 3),
+        "alerts": alerts,
+        "detected_watch_targets": len(first_alert),
+        "expected_watch_targets": expected,
+        "detection_latency_ms_p50": percentile(latencies, 50),
+        "detection_latency_ms_p95": percentile(latencies, 95),
+        "detection_latency_ms_max": percentile(latencies, 100),
+        "upstream_requests": upstream_requests,
+        "upstream_requests_per_watch": round(upstream_requests / args.watches, 2),
+        "upstream_polls_per_sec": round(upstream_requests / elapsed, 2),
+        "upstream_errors": stats["errors"],
+        "cpu_sec_per_watch": round(cpu_used / args.watches, 5),
+        "rss_kb_per_watch": round(max(rss_after - rss_before, 0) / args.watches, 2),
+    }
+
+
+def compare(baseline_path, current):
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    print(f"\nComparison against {baseline_path} ({baseline['meta']['revision']} -> {current['meta']['revision']})")
+    for section in ("check_booking", "parsing", "monitoring"):
+        for metric, value in current[section].items():
+            old = baseline.get(section, {}).get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                change = f"{(value - old) / old * 100:+.1f}%"
+            else:
+                change = ""
+            print(f"  {section}.{metric:<32} {old!s:>12} -> {value!s:>12} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--watches", type=int, default=100)
+    parser.add_argument("--dates", type=int, default=3, help="distinct future dates the watches spread over")
+    parser.add_argument("--duration", type=float, default=25, help="seconds to monitor after creating watches")
+    parser.add_argument("--check-interval", type=float, default=4, help="CHECK_INTERVAL used by pvr_monitor")
+    parser.add_argument("--films", type=int, default=12)
+    parser.add_argument("--shows-per-film", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--sell-rate", type=float, default=0.0, help="fraction of shows selling seats per request")
+    parser.add_argument("--open-after", type=float, default=8)
+    parser.add_argument("--open-spread", type=float, default=4)
+    parser.add_argument("--request-rate", type=float, default=500, help="PVR_REQUEST_RATE used by pvr_monitor")
+    parser.add_argument("--latency-samples", type=int, default=20)
+    parser.add_argument("--throughput-rounds", type=int, default=3)
+    parser.add_argument("--parse-films", type=int, default=40, help="films in the payload used for the parsing benchmark")
+    parser.add_argument("--parse-rounds", type=int, default=50)
+    parser.add_argument("--capture-dir", help="record every csessions response here for benchmarks/replay_capture.py")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    proc, base = start_server(args, free_port())
+    try:
+        monitor = configure_monitor(args, base)
+        results = {
+            "meta": {
+                "revision": git_revision(),
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "params": vars(args),
+            },
+            "check_booking": bench_check_booking(monitor, args),
+            "parsing": bench_parsing(monitor, args),
+            "monitoring": bench_monitoring(monitor, args, base),
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Local multi-process check of cluster mode against benchmarks/fake_pvr_server.py.
+
+Runs this process as the coordinator (PVR_ROLE=coordinator) and starts polling
+workers (PVR_ROLE=worker) as subprocesses sharing one SQLite file. Part way
+through it kills one worker and starts a fresh one, then reports:
+
+  * whether every (watch, cinema, date) target was alerted
+  * how targets were spread over workers before and after the membership change
+  * upstream requests per target, to compare with a single-process run
+
+    python benchmarks/run_cluster.py --workers 3 --watches 40
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run_benchmarks import ALERT_PATTERN, ROOT, free_port, http_json, start_server
+
+
+def start_worker(env, name):
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "pvr_monitor.py")],
+                            env=dict(env, WORKER_ID=name), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def lease_spread(monitor):
+    return {worker: info["leases"] for worker, info in monitor.coordinator.stats()["workers"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--watches", type=int, default=30)
+    parser.add_argument("--dates", type=int, default=3)
+    parser.add_argument("--check-interval", type=float, default=2)
+    parser.add_argument("--lease-ttl", type=float, default=4)
+    parser.add_argument("--open-after", type=float, default=12, help="seconds until bookings open, after the worker swap")
+    parser.add_argument("--open-spread", type=float, default=6)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+
+    server_args = argparse.Namespace(films=6, shows_per_film=4, latency_ms=20, error_rate=0.0,
+                                     open_after=args.open_after, open_spread=args.open_spread)
+    proc, base = start_server(server_args, free_port())
+    db_dir = tempfile.mkdtemp(prefix="pvr-cluster-")
+    env = dict(os.environ,
+               PVR_SESSIONS_URL=f"{base}/api/v1/booking/content/csessions",
+               TELEGRAM_API_BASE=base,
+               BOT_TOKEN="bench",
+               CHAT_ID="bench",
+               WATCH_DB_PATH=os.path.join(db_dir, "cluster.db"),
+               CATALOG_PATH="",
+               CATALOG_TTL="0",
+               CHECK_INTERVAL=str(args.check_interval),
+               MIN_CHECK_INTERVAL=str(args.check_interval / 2),
+               POLL_STAGGER="0.5",
+               SESSIONS_CACHE_TTL="0",
+               ALERT_MERGE_WINDOW="0.2",
+               LEASE_TTL=str(args.lease_ttl),
+               CLUSTER_HEARTBEAT=str(args.lease_ttl / 4))
+    workers = {}
+    try:
+        for i in range(args.workers):
+            workers[f"worker-{i}"] = start_worker(dict(env, PVR_ROLE="worker"), f"worker-{i}")
+        os.environ.update(env, PVR_ROLE="coordinator")
+        sys.path.insert(0, ROOT)
+        import logging
+        import pvr_monitor as monitor
+        logging.getLogger().setLevel(logging.WARNING)
+
+        client = monitor.app.test_client()
+        cinemas = list(monitor.CINEMA_CODES)
+        dates = [(datetime.date.today() + datetime.timedelta(days=offset)).isoformat() for offset in range(1, args.dates + 1)]
+        expected = set()
+        for i in range(args.watches):
+            payload = {"cinemas": [cinemas[i % len(cinemas)]], "dates": [dates[i % len(dates)]], "chat_id": f"cluster-{i}"}
+            res = client.post("/watches", json=payload)
+            if res.status_code != 200:
+                raise RuntimeError(f"/watches failed: {res.json}")
+            expected.add((payload["chat_id"], monitor.CINEMA_CODES[payload["cinemas"][0]], payload["dates"][0]))
+
+        time.sleep(args.lease_ttl * 1.5)
+        spread_before = lease_spread(monitor)
+        victim = next(iter(workers))
+        workers.pop(victim).kill()  # no clean exit, so its leases have to expire
+        workers["worker-new"] = start_worker(dict(env, PVR_ROLE="worker"), "worker-new")
+        http_json(f"{base}/_reset", {"open_after": args.open_after})
+
+        time.sleep(args.duration)
+        spread_after = lease_spread(monitor)
+
+        stats = http_json(f"{base}/_stats")
+        upstream_requests = sum(count for _, _, count in stats["requests"])
+        alerted = set()
+        for _, chat_id, text in stats["telegram"]:
+            for dated, cinema in ALERT_PATTERN.findall(text):
+                alerted.add((chat_id, monitor.CINEMA_CODES.get(cinema), dated))
+        results = {
+            "workers": args.workers,
+            "killed": victim,
+            "targets": len({(cid, dated) for _, cid, dated in expected}),
+            "expected_watch_targets": len(expected),
+            "alerted_watch_targets": len(expected & alerted),
+            "leases_before": spread_before,
+            "leases_after": spread_after,
+            "upstream_requests": upstream_requests,
+            "upstream_requests_per_target": round(upstream_requests / len(stats["requests"]), 1),
+            "coordinator": monitor.coordinator.stats(),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            try:
+                worker.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+if __name__ == "__main__":
+    main()
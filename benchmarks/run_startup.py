@@ -0,0 +1,166 @@
+"""Cold-start timing for pvr_monitor against benchmarks/fake_pvr_server.py.
+
+Seeds a watch database through a first run, then starts `python pvr_monitor.py`
+from scratch several times and measures, from process spawn:
+
+  * healthy: /healthz answers
+  * ready: /readyz answers 200 (saved watches restored and polling)
+  * first_poll: the first csessions response was processed
+
+alongside the boot phases the process reports about itself on /readyz.
+
+    python benchmarks/run_startup.py --watches 200 --runs 5 --output startup.json
+"""
+import argparse
+import ast
+import datetime
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run_benchmarks import ROOT, free_port, git_revision, http_json, start_server
+
+
+def get_status(url):
+    """(status code, JSON body) or (None, None) while the server is not listening"""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as res:
+            return res.status, json.loads(res.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except OSError:
+        return None, None
+
+
+def cinema_names():
+    """Built-in cinema names, read from the source so this process never imports (and boots) the app"""
+    with open(os.path.join(ROOT, "pvr_monitor.py")) as source:
+        tree = ast.parse(source.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "CINEMA_CODES":
+            return list(ast.literal_eval(node.value))
+    raise RuntimeError("CINEMA_CODES not found in pvr_monitor.py")
+
+
+def start_app(env, port):
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "pvr_monitor.py")], env=dict(env, PORT=str(port)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_app(proc):
+    # SIGINT lets app.run return so the watch store flushes on exit
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def seed_watches(env, args):
+    port = free_port()
+    proc = start_app(env, port)
+    try:
+        deadline = time.time() + 30
+        while get_status(f"http://127.0.0.1:{port}/readyz")[0] != 200:
+            if time.time() > deadline:
+                raise RuntimeError("seed run never became ready")
+            time.sleep(0.1)
+        cinemas = cinema_names()
+        dates = [(datetime.date.today() + datetime.timedelta(days=offset)).isoformat() for offset in range(1, args.dates + 1)]
+        for i in range(args.watches):
+            http_json(f"http://127.0.0.1:{port}/watches",
+                      {"cinemas": [cinemas[i % len(cinemas)]], "dates": [dates[i % len(dates)]], "chat_id": f"startup-{i}"})
+        time.sleep(2)  # let the store's writer commit
+    finally:
+        stop_app(proc)
+
+
+def measure(env, args):
+    port = free_port()
+    spawned = time.perf_counter()
+    proc = start_app(env, port)
+    marks = {}
+    reported = {}
+    try:
+        deadline = spawned + args.timeout
+        while time.perf_counter() < deadline and "first_poll" not in marks:
+            code, body = get_status(f"http://127.0.0.1:{port}/readyz")
+            now = round(time.perf_counter() - spawned, 3)
+            if code is not None:
+                marks.setdefault("healthy", now)
+            if code == 200:
+                marks.setdefault("ready", now)
+                reported = body
+                if "first_poll" in body["phases"]:
+                    marks["first_poll"] = now
+            time.sleep(args.probe_interval)
+    finally:
+        stop_app(proc)
+    return {"from_spawn": marks, "reported_phases": reported.get("phases", {}), "errors": reported.get("errors", {})}
+
+
+def summarize(runs, field):
+    values = [run["from_spawn"][field] for run in runs if field in run["from_spawn"]]
+    if not values:
+        return None
+    return {"median": round(statistics.median(values), 3), "min": min(values), "max": max(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--watches", type=int, default=100)
+    parser.add_argument("--dates", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--poll-stagger", type=float, default=5, help="POLL_STAGGER for the measured runs")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    server_args = argparse.Namespace(films=12, shows_per_film=8, latency_ms=80, error_rate=0.0, open_after=0, open_spread=0)
+    server, base = start_server(server_args, free_port())
+    db_dir = tempfile.mkdtemp(prefix="pvr-startup-")
+    env = dict(os.environ,
+               PVR_SESSIONS_URL=f"{base}/api/v1/booking/content/csessions",
+               TELEGRAM_API_BASE=base,
+               BOT_TOKEN="bench",
+               CHAT_ID="bench",
+               WATCH_DB_PATH=os.path.join(db_dir, "startup.db"),
+               CATALOG_PATH=os.path.join(db_dir, "catalog.json"),
+               POLL_STAGGER=str(args.poll_stagger),
+               PVR_ROLE="standalone")
+    try:
+        seed_watches(env, args)
+        runs = [measure(env, args) for _ in range(args.runs)]
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    results = {
+        "revision": git_revision(),
+        "watches": args.watches,
+        "poll_stagger": args.poll_stagger,
+        "healthy_s": summarize(runs, "healthy"),
+        "ready_s": summarize(runs, "ready"),
+        "first_poll_s": summarize(runs, "first_poll"),
+        "runs": runs,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,43 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-import requests
 import time
+
+# Boot phases are measured from here, so this has to come before the other
+# imports (flask, aiohttp, requests...) for their load time to be counted.
+BOOT_STARTED = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, redirect, url_for, make_response
+import requests
+import aiohttp
+import asyncio
 import os
 import datetime
 import threading
 import json
+import re
+import random
+import functools
+import uuid
+import queue
+import heapq
+import itertools
+import collections
 import logging
-from flask_socketio import SocketIO, emit
+import sqlite3
+import atexit
+import bisect
+import hashlib
+import platform
+import signal
+import struct
+import sys
+import zlib
+import contextlib
+from array import array
+from contextlib import closing
+from urllib.parse import urlsplit
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
 from dotenv import load_dotenv
 
 # Load .env file for local testing
@@ -35,6 +66,8 @@ else:
     logging.info("✅ Telegram credentials found in environment variables")
 
 # === Cinema Code Map ===
+# Built-in seed for the cinema catalog; the catalog keeps these dicts up to date
+DEFAULT_LOCATION = {"chain": "PVR", "city": "Chennai", "lat": "12.883208", "lng": "80.3613280"}
 CINEMA_CODES = {
     "Grand Mall": "389",
     "Palazzo": "388",
@@ -49,6 +82,7 @@ CINEMA_CODES = {
     "Ampa": "358",
     "VR": "523"
 }
+CINEMA_NAMES = {cinema_id: name for name, cinema_id in CINEMA_CODES.items()}
 
 # === Screen Names for Each Theatre ===
 THEATRE_SCREENS = {
@@ -67,44 +101,683 @@ THEATRE_SCREENS = {
 }
 
 # === Global Variables ===
-alert_sent_map = {}
-monitoring_flag = threading.Event()
-monitoring_threads = []
-CHECK_INTERVAL = 60  # seconds
-logs = []
-
-def log_message(msg):
-    timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-    log_entry = f"{timestamp} - {msg}"
-    logs.append(log_entry)
-    if len(logs) > 100:  # Keep only last 100 logs
-        logs.pop(0)
-    logging.info(msg)
-    socketio.emit('log_update', {'message': log_entry})
-
-def send_telegram(msg):
-    """Send message via Telegram bot with proper token handling"""
-    if not BOT_TOKEN or not CHAT_ID:
+CHECK_INTERVAL = float(os.getenv("CHECK_INTERVAL", "60"))  # seconds
+MIN_CHECK_INTERVAL = float(os.getenv("MIN_CHECK_INTERVAL", "10"))  # seconds
+MAX_BACKOFF = int(os.getenv("MAX_BACKOFF", "600"))  # seconds
+CHANGE_BOOST_WINDOW = int(os.getenv("CHANGE_BOOST_WINDOW", "300"))  # seconds
+POLL_STAGGER = float(os.getenv("POLL_STAGGER", "5"))  # seconds
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "10"))
+SESSIONS_CACHE_TTL = float(os.getenv("SESSIONS_CACHE_TTL", "20"))  # seconds; serves one-off lookups, target pollers always fetch fresh
+PVR_TIMEOUT = float(os.getenv("PVR_TIMEOUT", "15"))  # seconds
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))  # seconds
+TELEGRAM_VERIFY_TIMEOUT = float(os.getenv("TELEGRAM_VERIFY_TIMEOUT", "5"))  # seconds
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "4"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+ALERT_MERGE_WINDOW = float(os.getenv("ALERT_MERGE_WINDOW", "3"))  # seconds
+TELEGRAM_CHAT_INTERVAL = 1.0  # Telegram allows about one message per second per chat
+TELEGRAM_GLOBAL_RATE = 25     # messages per second, under Telegram's 30/s bot limit
+TELEGRAM_MAX_MESSAGE = 4096
+LOG_CAPACITY = int(os.getenv("LOG_CAPACITY", "1000"))
+SOCKET_FLUSH_INTERVAL = float(os.getenv("SOCKET_FLUSH_INTERVAL", "0.5"))  # seconds between batched log frames
+SOCKET_MAX_BATCH = int(os.getenv("SOCKET_MAX_BATCH", "200"))  # records kept per room set per frame; older ones are dropped
+SOCKET_CLIENT_BACKLOG = int(os.getenv("SOCKET_CLIENT_BACKLOG", "50"))  # queued packets before a client counts as lagging
+WATCH_DB_PATH = os.getenv("WATCH_DB_PATH", "pvr_monitor.db")
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "1"))  # seconds
+MAX_WATCH_DATES = int(os.getenv("MAX_WATCH_DATES", "14"))  # dates one watch may cover
+PVR_ROLE = os.getenv("PVR_ROLE", "standalone")  # standalone, coordinator, worker or replay
+WORKER_ID = os.getenv("WORKER_ID") or f"{platform.node()}-{os.getpid()}"
+LEASE_TTL = float(os.getenv("LEASE_TTL", "15"))  # seconds a worker's heartbeat and leases stay valid
+CLUSTER_HEARTBEAT = float(os.getenv("CLUSTER_HEARTBEAT", "3"))  # seconds between worker lease renewals
+CLUSTER_EVENT_POLL = float(os.getenv("CLUSTER_EVENT_POLL", "0.5"))  # seconds between event flushes/reads
+PVR_REQUEST_RATE = float(os.getenv("PVR_REQUEST_RATE", "5"))  # csessions requests per second, per process
+PVR_REQUEST_BURST = int(os.getenv("PVR_REQUEST_BURST", "10"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # consecutive failures that open the circuit
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))  # seconds open before a probe; doubles on repeated trips
+SEAT_HISTORY_DAYS = int(os.getenv("SEAT_HISTORY_DAYS", "28"))  # days after a show's date its seat history is kept
+SEAT_DOWNSAMPLE_AFTER = int(os.getenv("SEAT_DOWNSAMPLE_AFTER", "86400"))  # seconds before samples are thinned
+SEAT_DOWNSAMPLE_BUCKET = int(os.getenv("SEAT_DOWNSAMPLE_BUCKET", "900"))  # seconds per sample once thinned
+SEAT_FLUSH_INTERVAL = float(os.getenv("SEAT_FLUSH_INTERVAL", "60"))  # seconds between seat history writes
+SEAT_FILL_MAX_POINTS = int(os.getenv("SEAT_FILL_MAX_POINTS", "5000"))  # most points a fill curve may ask for
+CATALOG_PATH = os.getenv("CATALOG_PATH", "pvr_catalog.json")
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "86400"))  # seconds before cinemas are re-probed for screens; 0 disables
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")  # record raw csessions responses here for replay; empty disables
+CAPTURE_SEGMENT_BYTES = int(os.getenv("CAPTURE_SEGMENT_BYTES", str(16 * 1024 * 1024)))  # bytes before a capture segment rolls over
+CAPTURE_MAX_SEGMENTS = int(os.getenv("CAPTURE_MAX_SEGMENTS", "64"))  # oldest segments are deleted beyond this; 0 keeps all
+CATALOG_WARMUP_DELAY = float(os.getenv("CATALOG_WARMUP_DELAY", "30"))  # max seconds a boot-time catalog refresh waits for the first poll
+
+# === Boot Phases ===
+class BootState:
+    """Named boot milestones, in seconds since BOOT_STARTED; /readyz turns 200 once watches are restored."""
+
+    def __init__(self):
+        self.phases = {}  # name -> seconds since BOOT_STARTED
+        self.errors = {}
+        self._reached = {}  # name -> threading.Event
+        self._lock = threading.Lock()
+
+    def _event(self, name):
+        with self._lock:
+            return self._reached.setdefault(name, threading.Event())
+
+    def mark(self, name):
+        """Record a phase the first time it is reached"""
+        event = self._event(name)
+        if event.is_set():
+            return
+        self.phases[name] = round(time.perf_counter() - BOOT_STARTED, 4)
+        event.set()
+        logging.info(f"⏱️ Boot phase {name} at {self.phases[name]:.3f}s")
+
+    def fail(self, name, error):
+        self.errors[name] = str(error)
+
+    def reached(self, name):
+        return self._event(name).is_set()
+
+    def wait(self, name, timeout=None):
+        return self._event(name).wait(timeout)
+
+    def stats(self):
+        return {'uptime': round(time.perf_counter() - BOOT_STARTED, 3), 'phases': dict(self.phases), 'errors': dict(self.errors)}
+
+
+boot = BootState()
+# === Metrics ===
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRICS = []
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class _ShardedMetric:
+    """Base for metrics that write to a per-thread shard, summed only when /metrics is scraped."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []  # (thread, shard dict)
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+        METRICS.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _collect(self):
+        with self._shards_lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, dict(shard))
+            self._shards = live
+            merged = {}
+            self._merge(merged, self._retired)
+            for _, shard in live:
+                self._merge(merged, dict(shard))
+            return merged
+
+    def _label_text(self, labels, extra=None):
+        pairs = list(zip(self.labelnames, labels))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+class Counter(_ShardedMetric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _merge(target, source):
+        for labels, value in source.items():
+            target[labels] = target.get(labels, 0) + value
+
+    def render(self):
+        return [f"{self.name}{self._label_text(labels)} {value}" for labels, value in sorted(self._collect().items())]
+
+class Histogram(_ShardedMetric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            entry = shard[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][index] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    @staticmethod
+    def _merge(target, source):
+        for labels, (counts, total, count) in source.items():
+            existing = target.get(labels)
+            if existing is None:
+                target[labels] = [list(counts), total, count]
+            else:
+                existing[0] = [a + b for a, b in zip(existing[0], counts)]
+                existing[1] += total
+                existing[2] += count
+
+    def render(self):
+        lines = []
+        for labels, (counts, total, count) in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._label_text(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_text(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {total}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {count}")
+        return lines
+
+class Gauge:
+    """Gauge read from a callback at scrape time; fn returns a number or {label tuple: number}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        METRICS.append(self)
+
+    _label_text = _ShardedMetric._label_text
+
+    def render(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [f"{self.name} {value}"]
+        return [f"{self.name}{self._label_text(labels)} {number}" for labels, number in sorted(value.items())]
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            logging.warning(f"Failed to render metric {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+upstream_latency = Histogram('pvr_upstream_latency_seconds', 'csessions request latency', ['cinema'])
+upstream_retries = Counter('pvr_upstream_retries_total', 'csessions attempts that were retried', ['cinema'])
+upstream_rejected = Counter('pvr_upstream_rejected_total', 'csessions requests refused by the open circuit', ['cinema'])
+upstream_failures = Counter('pvr_upstream_failures_total', 'csessions attempts that failed', ['cinema', 'reason'])
+poll_lag = Histogram('pvr_poll_lag_seconds', 'How late a poll woke up versus its scheduled time',
+                     buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+filter_eval = Histogram('pvr_filter_eval_seconds', 'Time to match one target diff against one job',
+                        buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+telegram_latency = Histogram('telegram_send_latency_seconds', 'Telegram sendMessage latency', ['outcome'])
+socketio_emits = Counter('socketio_emits_total', 'SocketIO events emitted', ['event'])
+
+def socket_emit(event, payload, **kwargs):
+    socketio_emits.inc(event)
+    socketio.emit(event, payload, **kwargs)
+
+# === Log Store ===
+LOG_LEVEL_PREFIXES = (("❌", "error"), ("☠️", "error"), ("⚠️", "warning"))
+
+class LogBuffer:
+    """Fixed-capacity, thread-safe ring buffer of log records with an increasing seq per record.
+
+    Cursors are (seq, epoch) pairs; epoch is new for every buffer, since seq restarts with the process.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.capacity = capacity
+        self.epoch = uuid.uuid4().hex[:8]
+        self._slots = [None] * capacity
+        self._next_seq = 1
+        self._oldest_seq = 1
+        self._lock = threading.Lock()
+
+    def append(self, message, level="info", cinema=None, job_id=None):
+        now = datetime.datetime.now()
+        with self._lock:
+            seq = self._next_seq
+            record = {
+                'seq': seq,
+                'time': now.isoformat(timespec='seconds'),
+                'level': level,
+                'cinema': cinema,
+                'job_id': job_id,
+                'message': message,
+                'text': f"{now.strftime('%H:%M:%S')} - {message}"
+            }
+            self._slots[seq % self.capacity] = record
+            self._next_seq = seq + 1
+            self._oldest_seq = max(self._oldest_seq, self._next_seq - self.capacity)
+        return record
+
+    def since(self, seq=0, limit=None):
+        """Records with seq greater than the cursor, oldest first"""
+        with self._lock:
+            start = max(seq + 1, self._oldest_seq)
+            end = self._next_seq
+            if limit is not None:
+                end = min(end, start + limit)
+            return [self._slots[i % self.capacity] for i in range(start, end)]
+
+    def clear(self):
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._oldest_seq = self._next_seq
+
+    def cursor(self, seq, epoch=None):
+        """A client's cursor, or 0 when it belongs to another epoch (a previous process) or runs ahead of this buffer"""
+        if (epoch and epoch != self.epoch) or seq > self.last_seq:
+            return 0
+        return seq
+
+    @property
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def __len__(self):
+        with self._lock:
+            return self._next_seq - self._oldest_seq
+
+
+log_store = LogBuffer()
+
+# === Live Updates ===
+ALL_ROOM = 'all'
+
+def job_room(job_id):
+    return f"job:{job_id}"
+
+def cinema_room(cinema):
+    return f"cinema:{cinema}"
+
+def record_rooms(cinema=None, job_id=None):
+    """Rooms an event about this cinema and/or job is delivered to"""
+    rooms = [ALL_ROOM]
+    if cinema:
+        rooms.append(cinema_room(cinema))
+    if job_id:
+        rooms.append(job_room(job_id))
+    return tuple(rooms)
+
+class LiveBroadcaster:
+    """Coalesces log records into periodic, room-scoped 'log_batch' SocketIO frames from one flusher thread."""
+
+    def __init__(self):
+        self._pending = {}   # room tuple -> deque of records
+        self._dropped = {}   # room tuple -> records dropped since the last frame
+        self._lock = threading.Lock()
+        self._thread = None
+        self.clients = 0
+        self.lagging = {}    # sid -> rooms it was in when paused
+        self.counters = {'records': 0, 'frames': 0, 'dropped': 0, 'paused_clients': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="socketio-broadcaster", daemon=True)
+                self._thread.start()
+
+    def publish(self, record):
+        if not self.clients:
+            return
+        self.start()
+        rooms = record_rooms(record['cinema'], record['job_id'])
+        with self._lock:
+            pending = self._pending.get(rooms)
+            if pending is None:
+                pending = self._pending[rooms] = collections.deque(maxlen=SOCKET_MAX_BATCH)
+            elif len(pending) == SOCKET_MAX_BATCH:
+                self._dropped[rooms] = self._dropped.get(rooms, 0) + 1
+                self.counters['dropped'] += 1
+            pending.append(record)
+            self.counters['records'] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(SOCKET_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("SocketIO broadcaster flush failed")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            dropped, self._dropped = self._dropped, {}
+        self._check_backlogs()
+        for rooms, records in pending.items():
+            socket_emit('log_batch', {
+                'entries': [{key: record[key] for key in ('seq', 'level', 'cinema', 'job_id', 'text')} for record in records],
+                'dropped': dropped.get(rooms, 0)
+            }, to=list(rooms))
+            self.counters['frames'] += 1
+
+    def _check_backlogs(self):
+        """Pause clients that can't keep up and resume them once their queue drains"""
+        manager = socketio.server.manager
+        for eio_sid, sock in list(socketio.server.eio.sockets.items()):
+            sid = manager.sid_from_eio_sid(eio_sid, '/')
+            if sid is None:
+                continue
+            backlog = sock.queue.qsize()
+            if sid in self.lagging:
+                if backlog == 0:
+                    for room in self.lagging.pop(sid):
+                        socketio.server.enter_room(sid, room)
+                    socket_emit('resync', {'reason': 'backlog'}, to=sid)
+            elif backlog > SOCKET_CLIENT_BACKLOG:
+                rooms = [room for room in manager.get_rooms(sid, '/') if room not in (None, sid)]
+                for room in rooms:
+                    socketio.server.leave_room(sid, room)
+                self.lagging[sid] = rooms
+                self.counters['paused_clients'] += 1
+
+    def connected(self, sid, rooms):
+        with self._lock:
+            self.clients += 1
+        for room in rooms:
+            socketio.server.enter_room(sid, room)
+
+    def disconnected(self, sid):
+        with self._lock:
+            self.clients = max(self.clients - 1, 0)
+        self.lagging.pop(sid, None)
+
+    def stats(self):
+        return dict(self.counters, clients=self.clients, lagging_clients=len(self.lagging))
+
+
+broadcaster = LiveBroadcaster()
+
+def log_message(msg, level=None, cinema=None, job_id=None):
+    if level is None:
+        level = next((name for prefix, name in LOG_LEVEL_PREFIXES if msg.startswith(prefix)), "info")
+    record = log_store.append(msg, level, cinema, job_id)
+    logging.log(logging.getLevelName(level.upper()), msg)
+    broadcaster.publish(record)
+
+# === Cinema Catalog ===
+class CinemaCatalog:
+    """Cinemas with their chain, city, location and screen names, in memory and cached on disk at CATALOG_PATH."""
+
+    def __init__(self, path=CATALOG_PATH, ttl=CATALOG_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.cinemas = {}  # name -> {'cid', 'chain', 'city', 'lat', 'lng', 'screens'}
+        self.version = 0
+        self.refreshed_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load(self):
+        for name, cinema_id in CINEMA_CODES.items():
+            self.cinemas[name] = dict(DEFAULT_LOCATION, cid=cinema_id, screens=list(THEATRE_SCREENS.get(name, [])))
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as handle:
+                    cached = json.load(handle)
+                for name, entry in cached.get('cinemas', {}).items():
+                    known = self.cinemas.get(name, dict(DEFAULT_LOCATION, screens=[]))
+                    merged = dict(known, **entry)
+                    merged['screens'] = known['screens'] + [screen for screen in entry.get('screens', []) if screen not in known['screens']]
+                    if 'cid' not in merged:
+                        logging.warning(f"⚠️ Catalog entry {name} has no cid, skipping it")
+                        continue
+                    self.cinemas[name] = merged
+                self.refreshed_at = cached.get('refreshed_at', 0.0)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"⚠️ Ignoring unreadable cinema catalog {self.path}: {e}")
+        self._publish()
+
+    def _publish(self):
+        """Mirror the catalog into CINEMA_CODES, CINEMA_NAMES and THEATRE_SCREENS"""
+        for name, entry in self.cinemas.items():
+            CINEMA_CODES[name] = entry['cid']
+            CINEMA_NAMES[entry['cid']] = name
+            THEATRE_SCREENS[name] = entry['screens']
+        self.version += 1
+
+    def entry(self, cinema_id):
+        return self.cinemas.get(CINEMA_NAMES.get(cinema_id), DEFAULT_LOCATION)
+
+    def booking_link(self, cinema_id):
+        return f"https://www.pvrcinemas.com/cinemasessions/{self.entry(cinema_id)['city']}/qr/{cinema_id}"
+
+    def observe(self, cinema_id, records):
+        """Learn screen names from a parsed csessions response"""
+        entry = self.cinemas.get(CINEMA_NAMES.get(cinema_id))
+        if entry is None or not records:
+            return
+        known = entry['screens']
+        seen = {record.screen for record in records if record.screen}
+        if seen.issubset(known):
+            return
+        with self._lock:
+            # Known screens keep their order; new ones are appended
+            entry['screens'] = THEATRE_SCREENS[CINEMA_NAMES[cinema_id]] = entry['screens'] + sorted(seen.difference(entry['screens']))
+            self.version += 1
+            self._dirty = True
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = {'refreshed_at': self.refreshed_at, 'cinemas': self.cinemas}
+            encoded = json.dumps(snapshot, indent=1, sort_keys=True)
+            self._dirty = False
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as handle:
+            handle.write(encoded)
+        os.replace(temp_path, self.path)
+
+    def start(self):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cinema-catalog", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # A boot-time refresh would probe every cinema at top priority; let watched targets poll first
+        if time.time() - self.refreshed_at >= self.ttl:
+            boot.wait('first_poll', CATALOG_WARMUP_DELAY)
+        while True:
+            try:
+                if time.time() - self.refreshed_at >= self.ttl:
+                    self.refresh()
+                if self._dirty:
+                    self.save()
+            except Exception as e:
+                log_message(f"⚠️ Cinema catalog refresh failed: {e}")
+            time.sleep(min(self.ttl, 60))
+
+    def refresh(self):
+        """Probe every cinema for today's sessions; screen names are learned on the way through"""
+        today = datetime.date.today().isoformat()
+        cinema_ids = [entry['cid'] for entry in self.cinemas.values()]
+
+        async def probe_all():
+            await asyncio.gather(*[fetch_sessions(cinema_id, today) for cinema_id in cinema_ids], return_exceptions=True)
+
+        engine.run(probe_all())
+        self.refreshed_at = time.time()
+        self._dirty = True
+        log_message(f"🗺️ Cinema catalog refreshed ({len(cinema_ids)} cinemas)")
+
+    def stats(self):
+        return {
+            'cinemas': len(self.cinemas),
+            'cities': sorted({entry['city'] for entry in self.cinemas.values()}),
+            'version': self.version,
+            'refreshed_age': round(time.time() - self.refreshed_at) if self.refreshed_at else None
+        }
+
+
+catalog = CinemaCatalog()
+catalog.load()
+
+# === HTTP Client Layer ===
+PVR_SESSIONS_URL = os.getenv("PVR_SESSIONS_URL", "https://api3.pvrcinemas.com/api/v1/booking/content/csessions")
+PVR_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "application/json",
+    "Content-Type": "application/json",
+    "Authorization": "Bearer",
+    "chain": "PVR",
+    "city": "Chennai",
+    "country": "INDIA",
+    "appVersion": "1.0",
+    "platform": "WEBSITE",
+    "Origin": "https://www.pvrcinemas.com",
+    "Referer": "https://www.pvrcinemas.com/",
+}
+TELEGRAM_API = f"{os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org')}/bot{BOT_TOKEN}"
+
+class HostMetrics:
+    """Per-host request, new-connection and handshake timing counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = {'requests': 0, 'new_connections': 0, 'handshake_ms_total': 0.0, 'handshake_ms_max': 0.0}
+        return stats
+
+    def record_request(self, host):
+        with self._lock:
+            self._host(host)['requests'] += 1
+
+    def record_connect(self, host, elapsed_ms):
+        with self._lock:
+            stats = self._host(host)
+            stats['new_connections'] += 1
+            stats['handshake_ms_total'] += elapsed_ms
+            stats['handshake_ms_max'] = max(stats['handshake_ms_max'], elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            report = {}
+            for host, stats in self._hosts.items():
+                reused = max(stats['requests'] - stats['new_connections'], 0)
+                report[host] = {
+                    'requests': stats['requests'],
+                    'new_connections': stats['new_connections'],
+                    'reused_connections': reused,
+                    'reuse_ratio': round(reused / stats['requests'], 3) if stats['requests'] else 0.0,
+                    'avg_handshake_ms': round(stats['handshake_ms_total'] / stats['new_connections'], 2) if stats['new_connections'] else 0.0,
+                    'max_handshake_ms': round(stats['handshake_ms_max'], 2)
+                }
+            return report
+
+
+http_metrics = HostMetrics()
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start_time = time.perf_counter()
+        super().connect()
+        http_metrics.record_connect(self.host, (time.perf_counter() - start_time) * 1000)
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Keep-alive adapter whose new HTTPS connections report handshake time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme, https=_TimedHTTPSConnectionPool)
+
+def _count_request(response, *args, **kwargs):
+    http_metrics.record_request(urlsplit(response.url).hostname)
+
+def build_telegram_session():
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=TELEGRAM_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.hooks['response'].append(_count_request)
+    return session
+
+def build_pvr_session():
+    """aiohttp session for csessions calls; must be created on the engine loop"""
+    async def on_request_start(session, ctx, params):
+        ctx.host = params.url.host
+
+    async def on_request_end(session, ctx, params):
+        http_metrics.record_request(ctx.host)
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        http_metrics.record_connect(ctx.host, (time.perf_counter() - ctx.connect_start) * 1000)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=MAX_CONCURRENT_REQUESTS, keepalive_timeout=60),
+        headers=PVR_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=PVR_TIMEOUT),
+        trace_configs=[trace_config]
+    )
+
+
+telegram_http = build_telegram_session()
+
+def deliver_telegram(msg, chat_id=None):
+    """Send one message and report (sent, retryable, retry_after) for the notification worker"""
+    chat_id = chat_id or CHAT_ID
+    if not BOT_TOKEN or not chat_id:
         log_message("❌ Telegram not configured - missing BOT_TOKEN or CHAT_ID")
-        return False
+        return False, False, None
 
     try:
-        base_url = f"https://api.telegram.org/bot{BOT_TOKEN}"
-        send_message_url = f"{base_url}/sendMessage"
-        
         params = {
-            "chat_id": CHAT_ID,
+            "chat_id": chat_id,
             "text": msg,
             "parse_mode": "HTML",
             "disable_web_page_preview": True
         }
         
-        log_message(f"📤 Sending Telegram message to chat {CHAT_ID}")
-        response = requests.post(send_message_url, json=params, timeout=10)
+        log_message(f"📤 Sending Telegram message to chat {chat_id}")
+        response = telegram_http.post(f"{TELEGRAM_API}/sendMessage", json=params, timeout=TELEGRAM_TIMEOUT)
         response.raise_for_status()  # Raises exception for 4XX/5XX status codes
         
         log_message("✅ Telegram message sent successfully")
-        return True
+        return True, False, None
         
     except requests.exceptions.HTTPError as http_err:
         error_msg = f"HTTP error occurred: {http_err}"
@@ -113,14 +786,29 @@ def send_telegram(msg):
         elif response.status_code == 403:
             error_msg += " (Bot blocked by user or no permissions)"
         log_message(f"❌ {error_msg}")
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            return False, True, retry_after
+        return False, response.status_code >= 500, None
         
     except requests.exceptions.RequestException as req_err:
         log_message(f"❌ Request failed: {req_err}")
+        return False, True, None
         
     except Exception as e:
         log_message(f"❌ Unexpected error: {e}")
         
-    return False
+    return False, False, None
+
+def send_telegram(msg, chat_id=None):
+    """Send message via Telegram bot with proper token handling; blocks until Telegram answers"""
+    start_time = time.perf_counter()
+    sent = deliver_telegram(msg, chat_id)[0]
+    telegram_latency.observe(time.perf_counter() - start_time, 'sent' if sent else 'failed')
+    return sent
 
 
 def verify_bot_token():
@@ -130,10 +818,7 @@ def verify_bot_token():
         return False
 
     try:
-        base_url = f"https://api.telegram.org/bot{BOT_TOKEN}"
-        get_me_url = f"{base_url}/getMe"
-        
-        response = requests.get(get_me_url, timeout=5)
+        response = telegram_http.get(f"{TELEGRAM_API}/getMe", timeout=TELEGRAM_VERIFY_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         
@@ -156,13 +841,10 @@ def verify_chat_id():
         return False
 
     try:
-        base_url = f"https://api.telegram.org/bot{BOT_TOKEN}"
-        send_message_url = f"{base_url}/sendMessage"
-        
-        response = requests.post(
-            send_message_url,
+        response = telegram_http.post(
+            f"{TELEGRAM_API}/sendMessage",
             json={"chat_id": CHAT_ID, "text": "🔍 Connection test"},
-            timeout=5
+            timeout=TELEGRAM_VERIFY_TIMEOUT
         )
         response.raise_for_status()
         
@@ -181,265 +863,2739 @@ def verify_chat_id():
         log_message(f"❌ Chat verification error: {e}")
         return False
 
-def check_booking(cinema_id, selected_date):
-    url = "https://api3.pvrcinemas.com/api/v1/booking/content/csessions"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": "Bearer",
-        "chain": "PVR",
-        "city": "Chennai",
-        "country": "INDIA",
-        "appVersion": "1.0",
-        "platform": "WEBSITE",
-        "Origin": "https://www.pvrcinemas.com",
-        "Referer": "https://www.pvrcinemas.com/",
-    }
+# === Notification Dispatcher ===
+class Notification:
+    __slots__ = ("chat_id", "parts", "callbacks", "mergeable", "attempts", "ready_at")
+
+    def __init__(self, chat_id, text, mergeable, ready_at, on_done=None):
+        self.chat_id = chat_id
+        self.parts = [text]
+        self.callbacks = [on_done] if on_done else []
+        self.mergeable = mergeable
+        self.attempts = 0
+        self.ready_at = ready_at
+
+    def finish(self, delivered):
+        """Tell every merged part's sender whether Telegram took the message"""
+        for callback in self.callbacks:
+            try:
+                callback(delivered)
+            except Exception as e:
+                log_message(f"⚠️ Notification callback failed: {e}")
+
+    @property
+    def text(self):
+        return "<br><br>━━━━━━━━━━<br><br>".join(self.parts)
+
+class NotificationDispatcher:
+    """Background Telegram sender: one worker thread that paces, merges, retries and dead-letters messages."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self._scheduled = []  # heap of (ready_at, seq, Notification)
+        self._seq = itertools.count()
+        self._merging = {}    # chat_id -> Notification still open for merging
+        self._chat_next = {}  # chat_id -> earliest monotonic time for the next send
+        self._global_next = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dead_letters = collections.deque(maxlen=100)
+        self.counters = {'queued': 0, 'sent': 0, 'merged': 0, 'retried': 0, 'dropped': 0, 'dead_lettered': 0}
+        self.captured = None  # a list while replaying a capture: alerts land here instead of Telegram
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, msg, chat_id=None, merge=False, on_done=None):
+        """Queue a message without blocking; returns False if it was dropped, in which case on_done is not called"""
+        chat_id = chat_id or CHAT_ID
+        if self.captured is not None:
+            self.captured.append((chat_id, msg))  # replay: collect alerts instead of sending them
+            if on_done:
+                on_done(True)
+            return True
+        if not BOT_TOKEN or not chat_id:
+            log_message("❌ Telegram not configured - missing BOT_TOKEN or CHAT_ID")
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((chat_id, msg, merge, on_done))
+        except queue.Full:
+            self.counters['dropped'] += 1
+            self._dead_letter(chat_id, msg, "queue full")
+            return False
+        self.counters['queued'] += 1
+        return True
+
+    def _run(self):
+        while True:
+            timeout = max(self._scheduled[0][0] - time.monotonic(), 0) if self._scheduled else None
+            try:
+                chat_id, msg, merge, on_done = self._queue.get(timeout=timeout)
+                self._accept(chat_id, msg, merge, on_done)
+            except queue.Empty:
+                pass
+            
+            while self._scheduled and self._scheduled[0][0] <= time.monotonic():
+                _, _, notification = heapq.heappop(self._scheduled)
+                self._process(notification)
+
+    def _schedule(self, notification):
+        heapq.heappush(self._scheduled, (notification.ready_at, next(self._seq), notification))
+
+    def _accept(self, chat_id, msg, merge, on_done=None):
+        now = time.monotonic()
+        if merge:
+            open_batch = self._merging.get(chat_id)
+            if open_batch is not None and len(open_batch.text) + len(msg) < TELEGRAM_MAX_MESSAGE:
+                open_batch.parts.append(msg)
+                if on_done:
+                    open_batch.callbacks.append(on_done)
+                self.counters['merged'] += 1
+                return
+            notification = Notification(chat_id, msg, True, now + ALERT_MERGE_WINDOW, on_done)
+            self._merging[chat_id] = notification
+        else:
+            notification = Notification(chat_id, msg, False, now, on_done)
+        self._schedule(notification)
+
+    def _process(self, notification):
+        if self._merging.get(notification.chat_id) is notification:
+            del self._merging[notification.chat_id]
+        
+        now = time.monotonic()
+        allowed_at = max(self._chat_next.get(notification.chat_id, 0.0), self._global_next)
+        if allowed_at > now:
+            notification.ready_at = allowed_at
+            self._schedule(notification)
+            return
+        self._chat_next[notification.chat_id] = now + TELEGRAM_CHAT_INTERVAL
+        self._global_next = now + 1 / TELEGRAM_GLOBAL_RATE
+        
+        notification.attempts += 1
+        start_time = time.perf_counter()
+        sent, retryable, retry_after = deliver_telegram(notification.text, notification.chat_id)
+        telegram_latency.observe(time.perf_counter() - start_time, 'sent' if sent else 'failed')
+        if sent:
+            self.counters['sent'] += 1
+            notification.finish(True)
+        elif retryable and notification.attempts < NOTIFY_MAX_ATTEMPTS:
+            delay = retry_after if retry_after else min(2 ** notification.attempts, 60) * random.uniform(0.5, 1.0)
+            if retry_after:
+                # Telegram's flood wait applies to the whole chat, not just this message
+                self._chat_next[notification.chat_id] = now + retry_after
+            notification.ready_at = now + delay
+            self.counters['retried'] += 1
+            log_message(f"🔁 Retrying Telegram message to chat {notification.chat_id} in {delay:.1f}s")
+            self._schedule(notification)
+        else:
+            self._dead_letter(notification.chat_id, notification.text, f"gave up after {notification.attempts} attempt(s)")
+            notification.finish(False)
+
+    def _dead_letter(self, chat_id, msg, reason):
+        self.counters['dead_lettered'] += 1
+        self.dead_letters.append({
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'chat_id': chat_id,
+            'reason': reason,
+            'message': msg
+        })
+        log_message(f"☠️ Telegram message to chat {chat_id} dead-lettered ({reason})")
+
+    def stats(self):
+        return dict(self.counters, queue_depth=self._queue.qsize(), scheduled=len(self._scheduled))
+
+
+notifier = NotificationDispatcher()
+
+# === Async Polling Engine ===
+class PrioritySlots:
+    """Concurrency limiter for the engine loop that hands freed slots to the lowest priority value first"""
+
+    def __init__(self, slots):
+        self._free = slots
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.waiting = 0
+
+    async def acquire(self, priority=0):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        self.waiting += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot was handed over just as we were cancelled
+            raise
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+class PollingEngine:
+    """Runs every cinema monitor as a task on one background event loop"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_REQUESTS):
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self.semaphore = None
+        self.http = None
+        self.tasks = {}  # key -> asyncio.Task
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            ready = threading.Event()
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="polling-engine", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = PrioritySlots(self.max_concurrency)
+        ready.set()
+        self.loop.run_forever()
+
+    async def get_http(self):
+        """Shared aiohttp session, created lazily inside the engine loop"""
+        if self.http is None or self.http.closed:
+            self.http = build_pvr_session()
+        return self.http
+
+    def ensure(self, key, coro_fn, *args):
+        """Start coro_fn(*args) as the tracked task for key unless one is already running"""
+        self.start()
+        self.loop.call_soon_threadsafe(self._ensure, key, coro_fn, args)
+
+    def _ensure(self, key, coro_fn, args):
+        existing = self.tasks.get(key)
+        if existing is not None and not existing.done():
+            return
+        task = self.loop.create_task(coro_fn(*args))
+        self.tasks[key] = task
+        task.add_done_callback(lambda done: self.tasks.pop(key, None) if self.tasks.get(key) is done else None)
+
+    def call(self, fn, *args):
+        """Run a plain callback on the engine loop from any thread"""
+        self.start()
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def cancel(self, key):
+        """Cancel the tracked task for key; must run on the engine loop"""
+        task = self.tasks.get(key)
+        if task is not None:
+            task.cancel()
+
+    def run(self, coro, timeout=None):
+        """Run a one-off coroutine on the engine loop and block for its result"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    @property
+    def active_count(self):
+        return len(self.tasks)
+
+
+engine = PollingEngine()
+
+# === csessions Parsing ===
+# Show fields that carry seat/booking status, when the API includes them
+SHOW_STATE_FIELDS = ("ss", "status", "availableSeats", "totalSeats")
+
+class ShowRecord:
+    """The few fields of one csessions show that matching and diffing need"""
+    __slots__ = ("identity", "film", "screen", "time", "subtitle", "state")
+
+    def __init__(self, identity, film, screen, time, subtitle, state):
+        self.identity = identity
+        self.film = film
+        self.screen = screen
+        self.time = time
+        self.subtitle = subtitle
+        self.state = state
+
+    @classmethod
+    def from_show(cls, film_name, show):
+        screen = sys.intern(show.get("screenName") or "")
+        show_time = sys.intern(show.get("showTime") or "")
+        # Stable key for a show across polls
+        identity = show.get("sessionId") or (film_name, screen, show_time)
+        return cls(identity, film_name, screen, show_time, bool(show.get("subtitle", False)),
+                   tuple(show.get(field) for field in SHOW_STATE_FIELDS))
+
+    @property
+    def seats(self):
+        """(available, total) when the API reported both, else None"""
+        available, total = self.state[2], self.state[3]
+        if isinstance(available, int) and isinstance(total, int) and total > 0:
+            return available, total
+        return None
+
+    def to_list(self):
+        return [self.film, self.screen, self.time, self.subtitle, list(self.state)]
+
+    @classmethod
+    def from_list(cls, identity, values):
+        film, screen, show_time, subtitle, state = values
+        return cls(identity, sys.intern(film), sys.intern(screen), sys.intern(show_time), subtitle, tuple(state))
+
+_json_decoder = json.JSONDecoder()
+_JSON_WS = re.compile(r'[ \t\n\r]*')
+
+class _JSONWalker:
+    """Walks a JSON document in place, one member or element at a time.
+
+    Only the values a caller asks for are kept; skipped values are decoded and
+    dropped immediately, so the full tree never exists at once.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def _skip_ws(self):
+        self.pos = _JSON_WS.match(self.text, self.pos).end()
+
+    def _peek(self):
+        self._skip_ws()
+        return self.text[self.pos:self.pos + 1]
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.text, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self._skip_ws()
+        result, self.pos = _json_decoder.raw_decode(self.text, self.pos)
+        return result
+
+    def skip(self):
+        # raw_decode runs in C and is faster than matching brackets in Python; the
+        # skipped value is dropped straight away, so at most one subtree is alive
+        self.value()
+
+    def members(self):
+        """Yield the keys of the object at the cursor; the caller must value() or skip() each one"""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            if self._peek() == ',':
+                self.pos += 1
+                continue
+            self._expect('}')
+            return
+
+    def items(self):
+        """Yield once per element of the array at the cursor; the caller must value() or skip() each one"""
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._peek() == ',':
+                self.pos += 1
+                continue
+            self._expect(']')
+            return
+
+def _parse_film(walker, film_wanted, records):
+    film_name = None
+    experiences = None
+    for key in walker.members():
+        if key == "movieRe" and walker._peek() == '{':
+            movie = walker.value()
+            film_name = sys.intern(movie.get("filmName") or "")
+        elif key == "experienceSessions" and not (film_name is not None and film_wanted and not film_wanted(film_name)):
+            experiences = walker.value()
+        else:
+            walker.skip()
+    if film_name is None:
+        film_name = ""
+    if not isinstance(experiences, list) or (film_wanted and not film_wanted(film_name)):
+        return
+    for exp in experiences:
+        if not isinstance(exp, dict):
+            continue
+        for show in exp.get("shows") or ():
+            if isinstance(show, dict):
+                records.append(ShowRecord.from_show(film_name, show))
+
+def parse_sessions(body, film_wanted=None):
+    """Compact ShowRecords from a csessions response body, keeping only films film_wanted accepts.
+
+    Raises ValueError for a body that is not JSON or not shaped like csessions.
+    """
+    walker = _JSONWalker(body.decode("utf-8") if isinstance(body, bytes) else body)
+    records = []
+    if walker._peek() != '{':
+        raise json.JSONDecodeError("Expecting object", walker.text, walker.pos)
+    try:
+        for key in walker.members():
+            if key != "output" or walker._peek() != '{':
+                walker.skip()
+                continue
+            for output_key in walker.members():
+                if output_key != "cinemaMovieSessions" or walker._peek() != '[':
+                    walker.skip()
+                    continue
+                for _ in walker.items():
+                    if walker._peek() == '{':
+                        _parse_film(walker, film_wanted, records)
+                    else:
+                        walker.skip()
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"Unexpected csessions response: {e}") from e
+    return records
+
+# === Adaptive Poll Scheduler ===
+def days_until(selected_date):
+    """Whole days from today to a YYYY-MM-DD date, or None if it doesn't parse"""
+    try:
+        return (datetime.date.fromisoformat(selected_date) - datetime.date.today()).days
+    except ValueError:
+        return None
+
+def date_passed(selected_date):
+    days_left = days_until(selected_date)
+    return days_left is not None and days_left < 0
+
+class PollScheduler:
+    """Per-target (cid, dated) poll intervals with proximity, change and failure feedback"""
+
+    def __init__(self, base_interval=CHECK_INTERVAL):
+        self.base_interval = base_interval
+        self._lock = threading.Lock()
+        self._targets = {}
+
+    def _target(self, key):
+        state = self._targets.get(key)
+        if state is None:
+            state = self._targets[key] = {'failures': 0, 'last_change': None, 'last_interval': None}
+        return state
+
+    def record_success(self, key):
+        with self._lock:
+            self._target(key)['failures'] = 0
+
+    def mark_changed(self, key):
+        with self._lock:
+            self._target(key)['last_change'] = time.monotonic()
+
+    def record_failure(self, key):
+        with self._lock:
+            self._target(key)['failures'] += 1
+
+    def initial_delay(self):
+        """Random offset so targets started together don't poll in the same second"""
+        return random.uniform(0, POLL_STAGGER)
+
+    def retry_delay(self, attempt, retry_after=None):
+        """Exponential backoff with jitter between attempts of a single fetch"""
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+        return min(2 * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+    def next_delay(self, key):
+        with self._lock:
+            state = self._target(key)
+            if state['failures']:
+                interval = min(self.base_interval * 2 ** state['failures'], MAX_BACKOFF)
+            else:
+                interval = self.base_interval * self._proximity_factor(key[1])
+                if state['last_change'] and time.monotonic() - state['last_change'] < CHANGE_BOOST_WINDOW:
+                    interval = min(interval, self.base_interval * 0.25)
+            interval = max(interval * random.uniform(0.9, 1.1), MIN_CHECK_INTERVAL)
+            state['last_interval'] = round(interval, 1)
+            return interval
+
+    @staticmethod
+    def _proximity_factor(selected_date):
+        days_left = days_until(selected_date)
+        if days_left is None:
+            return 1.0
+        if days_left <= 0:
+            return 0.25
+        if days_left == 1:
+            return 0.5
+        if days_left <= 3:
+            return 0.75
+        if days_left <= 7:
+            return 1.0
+        return 2.0
+
+    def forget(self, key):
+        with self._lock:
+            self._targets.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {f"{cid}@{dated}": {'failures': state['failures'], 'last_interval': state['last_interval']}
+                    for (cid, dated), state in self._targets.items()}
+
+
+scheduler = PollScheduler()
+
+# === Upstream Protection ===
+class UpstreamUnavailable(Exception):
+    """The csessions circuit is open, so no request was made"""
+
+class FetchFailed(Exception):
+    """Every csessions attempt for a target failed; there is no answer to diff"""
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around the csessions endpoint; lives on the engine loop."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self._reopen_at = 0.0
+        self._probe_at = 0.0
+        self.rejected = 0
+
+    def _current_cooldown(self):
+        return min(self.cooldown * 2 ** max(self.trips - 1, 0), MAX_BACKOFF)
+
+    def allow(self):
+        now = time.monotonic()
+        if self.state == self.OPEN and now >= self._reopen_at:
+            self.state = self.HALF_OPEN
+            log_message("🟡 PVR circuit half-open, sending a probe request")
+        if self.state == self.CLOSED:
+            return True
+        # One probe at a time; a probe that never reports back frees the slot after PVR_TIMEOUT
+        if self.state == self.HALF_OPEN and now >= self._probe_at:
+            self._probe_at = now + PVR_TIMEOUT
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_in(self):
+        """Seconds until a refused caller is worth trying again"""
+        return max(self._reopen_at - time.monotonic(), 1.0)
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log_message(f"🟢 PVR circuit closed again after {self.trips} trip(s)")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._probe_at = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = datetime.datetime.now()
+            self._reopen_at = time.monotonic() + self._current_cooldown()
+            self._probe_at = 0.0
+            log_message(f"🔴 PVR circuit open after {self.failures} consecutive failure(s); pausing requests for {self._current_cooldown():.0f}s")
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'trips': self.trips,
+            'opened_at': self.opened_at.isoformat(timespec='seconds') if self.opened_at and self.state != self.CLOSED else None,
+            'retry_in': round(self.retry_in(), 1) if self.state == self.OPEN else None,
+            'rejected': self.rejected
+        }
+
+class RequestBudget:
+    """Token bucket every csessions request draws from, serving the nearest dates first when it runs dry."""
+
+    def __init__(self, rate=PVR_REQUEST_RATE, burst=PVR_REQUEST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._timer = None
+        self.granted = 0
+        self.waited = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority=0):
+        self._refill()
+        if self.tokens >= 1 and not self._waiters:
+            self.tokens -= 1
+            self.granted += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        self.waited += 1
+        self._schedule_wakeup()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.tokens += 1  # hand the token back; the caller is gone
+            raise
+
+    def _schedule_wakeup(self):
+        if self._timer is None and self._waiters:
+            delay = max((1 - self.tokens) / self.rate, 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self.tokens -= 1
+                self.granted += 1
+                waiter.set_result(None)
+        self._schedule_wakeup()
+
+    def stats(self):
+        self._refill()
+        priorities = [priority for priority, _, waiter in self._waiters if not waiter.done()]
+        return {
+            'rate_per_sec': self.rate,
+            'burst': self.burst,
+            'tokens': round(self.tokens, 2),
+            'waiting': len(priorities),
+            'waiting_by_days_out': dict(collections.Counter(priorities)),
+            'granted': self.granted,
+            'waited': self.waited
+        }
+
+
+breaker = CircuitBreaker()
+request_budget = RequestBudget()
+
+def is_upstream_failure(status):
+    """Whether an HTTP status says the upstream is struggling or pushing back (not a bad request of ours)"""
+    return status in (403, 429) or status >= 500
+
+async def _request_sessions(cinema_id, selected_date, films=None):
+    location = catalog.entry(cinema_id)
     payload = {
-        "city": "Chennai",
+        "city": location['city'],
         "cid": cinema_id,
-        "lat": "12.883208",
-        "lng": "80.3613280",
+        "lat": location['lat'],
+        "lng": location['lng'],
         "dated": selected_date,
         "qr": "YES",
         "cineType": "",
         "cineTypeQR": ""
     }
+    headers = {"chain": location['chain'], "city": location['city']}
+    http = await engine.get_http()
+    key = (cinema_id, selected_date)
+    cinema_label = CINEMA_NAMES.get(cinema_id, cinema_id)
+    # Nearer dates get budget tokens and request slots first when pollers queue up
+    priority = days_until(selected_date)
+    if priority is None:
+        priority = MAX_WATCH_DATES
     
     retry_count = 3
     for attempt in range(retry_count):
+        if not breaker.allow():
+            upstream_rejected.inc(cinema_label)
+            if attempt:
+                scheduler.record_failure(key)
+            raise UpstreamUnavailable(f"PVR circuit is {breaker.state}")
+        await request_budget.acquire(priority)
         try:
-            start_time = time.time()
-            res = requests.post(url, headers=headers, json=payload, timeout=15)
-            elapsed_time = (time.time() - start_time) * 1000  # in milliseconds
+            # Hold a concurrency slot only for the request itself, not the retry sleep
+            async with engine.semaphore.slot(priority):
+                start_time = time.time()
+                async with http.post(PVR_SESSIONS_URL, json=payload, headers=headers) as res:
+                    elapsed_time = (time.time() - start_time) * 1000  # in milliseconds
+                    upstream_latency.observe(elapsed_time / 1000, cinema_label)
+                    status = res.status
+                    retry_after = res.headers.get("Retry-After")
+                    body = await res.read() if status == 200 else None
             
-            if res.status_code != 200:
-                log_message(f"⚠️ API attempt {attempt + 1} failed with status {res.status_code} for {cinema_id}")
+            if body is not None and capture.enabled:
+                capture.record(cinema_id, selected_date, body)
+            if status != 200:
+                log_message(f"⚠️ API attempt {attempt + 1} failed with status {status} for {cinema_id}", cinema=cinema_label)
+                upstream_failures.inc(cinema_label, f"http_{status}")
+                if is_upstream_failure(status):
+                    breaker.record_failure()
                 if attempt < retry_count - 1:
-                    time.sleep(2)
+                    upstream_retries.inc(cinema_label)
+                    wait = float(retry_after) if status == 429 and retry_after and retry_after.isdigit() else None
+                    await asyncio.sleep(scheduler.retry_delay(attempt, wait))
                 continue
-                
-            data = res.json()
-            log_message(f"✅ API success for {cinema_id} (Response time: {elapsed_time:.2f}ms)")
-            return data.get("output", {}).get("cinemaMovieSessions", [])
             
-        except requests.exceptions.RequestException as e:
-            log_message(f"⚠️ API attempt {attempt + 1} failed with error: {str(e)}")
+            sessions = parse_sessions(body, film_matcher(films))
+            breaker.record_success()
+            catalog.observe(cinema_id, sessions)
+            scheduler.record_success(key)
+            log_message(f"✅ API success for {cinema_id} (Response time: {elapsed_time:.2f}ms)", cinema=cinema_label)
+            return sessions
+            
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log_message(f"⚠️ API attempt {attempt + 1} failed with error: {str(e) or type(e).__name__}", cinema=cinema_label)
+            upstream_failures.inc(cinema_label, 'timeout' if isinstance(e, asyncio.TimeoutError) else 'network')
+            breaker.record_failure()
             if attempt < retry_count - 1:
-                time.sleep(2)
+                upstream_retries.inc(cinema_label)
+                await asyncio.sleep(scheduler.retry_delay(attempt))
             continue
-        except json.JSONDecodeError:
-            log_message(f"⚠️ API attempt {attempt + 1} failed to decode JSON response")
+        except ValueError:  # JSONDecodeError or a body parse_sessions can't make sense of
+            log_message(f"⚠️ API attempt {attempt + 1} failed to decode JSON response", cinema=cinema_label)
+            upstream_failures.inc(cinema_label, 'bad_json')
+            breaker.record_failure()
             if attempt < retry_count - 1:
-                time.sleep(2)
+                upstream_retries.inc(cinema_label)
+                await asyncio.sleep(scheduler.retry_delay(attempt))
             continue
     
-    log_message(f"❌ All API attempts failed for {cinema_id}")
-    return []
+    scheduler.record_failure(key)
+    log_message(f"❌ All API attempts failed for {cinema_id}", cinema=cinema_label)
+    raise FetchFailed(f"all {retry_count} csessions attempts failed for {cinema_id} on {selected_date}")
 
-def parse_time_12h(timestr):
-    try:
-        return datetime.datetime.strptime(timestr, "%I:%M %p").time()
-    except ValueError:
-        log_message(f"⚠️ Failed to parse time string: {timestr}")
-        return None
+# === Shared csessions Fetch Layer ===
+class SessionsCache:
+    """Single-flight csessions fetches per (cid, dated, films) with a short TTL cache; lives on the engine loop.
 
-def is_time_in_range(show_time, from_time, to_time):
-    if not all([show_time, from_time, to_time]):
-        return True  # If any time is invalid, consider it in range
-    
+    Cached session lists are shared by every watcher and must be treated as read-only.
+    """
+
+    def __init__(self, ttl=SESSIONS_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}   # (cid, dated, films) -> (fetched_at, sessions)
+        self._inflight = {}  # (cid, dated, films) -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, cinema_id, selected_date, fresh=False, films=None):
+        key = (cinema_id, selected_date, films)
+        entry = None if fresh else self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(_request_sessions(cinema_id, selected_date, films))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._store(key, t))
+        # Shield so one cancelled watcher doesn't abort the fetch for the others
+        return await asyncio.shield(task)
+
+    def _store(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        now = time.monotonic()
+        self._entries[key] = (now, task.result())
+        for stale in [k for k, (fetched_at, _) in self._entries.items() if now - fetched_at >= self.ttl]:
+            del self._entries[stale]
+
+    def stats(self):
+        return {
+            'ttl': self.ttl,
+            'cached_targets': len(self._entries),
+            'in_flight': len(self._inflight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced
+        }
+
+
+sessions_cache = SessionsCache()
+
+async def fetch_sessions(cinema_id, selected_date, fresh=False, films=None):
+    """Shared entry point for csessions data used by every watcher.
+
+    fresh skips the TTL cache; films (a frozenset of normalized film needles)
+    keeps only the shows of matching films.
+    """
+    return await sessions_cache.get(cinema_id, selected_date, fresh, films)
+
+def check_booking(cinema_id, selected_date):
+    """Blocking wrapper around fetch_sessions, returning ShowRecords; never call from the engine loop itself.
+
+    Raises FetchFailed or UpstreamUnavailable when there is no answer.
+    """
+    return engine.run(fetch_sessions(cinema_id, selected_date))
+
+# === Session Snapshots ===
+class ShowSnapshot:
+    """Last-seen shows for one (cinema, date), keyed by show identity"""
+
+    def __init__(self, states=None, films=None):
+        self.states = states or {}  # identity -> tuple of SHOW_STATE_FIELDS values
+        self.shows = {}             # identity -> ShowRecord
+        self.polls = 1 if states else 0  # a restored snapshot counts as a previous poll
+        self.films = films          # film needles the last poll was parsed with, None for every film
+        self._source = None
+
+    def diff(self, sessions, films=None):
+        """Return (new, removed, changed) since the previous poll.
+
+        sessions is a list of ShowRecords parsed with the film needles films.
+        new holds ShowRecords in response order; removed and changed hold
+        identities. A list object identical to the last one (a shared cache
+        hit) short-circuits to an empty diff.
+        """
+        if sessions is self._source:
+            return [], [], []
+        self._source = sessions
+        self.polls += 1
+        
+        # When the film needles change, only films both polls parsed are compared;
+        # the rest are taken in (or dropped) silently
+        compared = None
+        if films != self.films:
+            before, after = film_matcher(self.films), film_matcher(films)
+            compared = lambda film: (before is None or before(film)) and (after is None or after(film))
+            self.films = films
+        
+        previous = self.states
+        current = {}
+        shows = {}
+        new_shows = []
+        changed = []
+        for record in sessions:
+            identity = record.identity
+            current[identity] = record.state
+            shows[identity] = record
+            if compared is not None and not compared(record.film):
+                continue
+            old_state = previous.get(identity)
+            if old_state is None:
+                new_shows.append(record)
+            elif old_state != record.state:
+                changed.append(identity)
+        
+        removed = [identity for identity in previous if identity not in current
+                   and (compared is None or (identity in self.shows and compared(self.shows[identity].film)))]
+        self.states = current
+        self.shows = shows
+        return new_shows, removed, changed
+
+    def current_shows(self):
+        """Every show seen in the last poll, in the same shape as diff's new list"""
+        return list(self.shows.values())
+
+    def apply(self, new_shows, removed_shows, changed_shows=(), full=False):
+        """Mirror a diff computed by another process; full replaces the mirror with new_shows.
+
+        changed_shows holds ShowRecords with their new state. Returns the
+        (new, removed, changed) records/identities relative to this mirror.
+        """
+        if full:
+            current = {record.identity: record for record in new_shows}
+            removed_shows = [identity for identity in self.shows if identity not in current]
+            changed_shows = [record for record in new_shows
+                             if record.identity in self.shows and self.shows[record.identity].state != record.state]
+            new_shows = [record for record in new_shows if record.identity not in self.shows]
+            self.shows = current
+        else:
+            for identity in removed_shows:
+                self.shows.pop(identity, None)
+            for record in itertools.chain(new_shows, changed_shows):
+                self.shows[record.identity] = record
+        self.polls += 1
+        return new_shows, removed_shows, changed_shows
+
+@functools.lru_cache(maxsize=4096)
+def parse_time_12h(timestr):
+    try:
+        return datetime.datetime.strptime(timestr, "%I:%M %p").time()
+    except ValueError:
+        log_message(f"⚠️ Failed to parse time string: {timestr}")
+        return None
+
+def is_time_in_range(show_time, from_time, to_time):
+    if not all([show_time, from_time, to_time]):
+        return True  # If any time is invalid, consider it in range
+    
     if from_time <= to_time:
         return from_time <= show_time <= to_time
     else:
         return show_time >= from_time or show_time <= to_time
 
-def monitor_cinema(cinema_name, cinema_id, selected_date, film_name_filter, screen_name_filters, time_from, time_to):
-    log_message(f"🔍 Starting monitoring for {cinema_name} on {selected_date}")
+# === Watch Filters ===
+@functools.lru_cache(maxsize=4096)
+def normalize_film_name(film_name):
+    return " ".join(film_name.casefold().split())
+
+@functools.lru_cache(maxsize=1024)
+def normalize_screen_name(screen_name):
+    return " ".join(screen_name.upper().split())
+
+def film_matcher(needles):
+    """Film-name predicate for a set of normalized film needles, or None to take every film"""
+    if needles is None:
+        return None
+    return lambda film_name: any(needle in normalize_film_name(film_name) for needle in needles)
+
+@functools.lru_cache(maxsize=4096)
+def show_minute(timestr):
+    """Minute of day for a '04:00 PM' style show time, or None if unparseable"""
+    show_time = parse_time_12h(timestr) if timestr else None
+    return show_time.hour * 60 + show_time.minute if show_time else None
+
+class WatchFilter:
+    """Film, screen and time-window filters for one cinema, compiled once per watch"""
+
+    def __init__(self, cinema_name, film_name_filter="", screen_name_filters=(), time_from=None, time_to=None):
+        self.film_name_filter = film_name_filter
+        self.screen_name_filters = list(screen_name_filters)
+        self.time_from = time_from
+        self.time_to = time_to
+        self._film_needle = normalize_film_name(film_name_filter) if film_name_filter else None
+        self._film_results = {}  # film name -> bool
+        
+        known_screens = {normalize_screen_name(screen) for screen in THEATRE_SCREENS.get(cinema_name, [])}
+        requested = {normalize_screen_name(screen) for screen in screen_name_filters}
+        # None means no screen filter; an empty set means none of the requested screens exist here
+        self.screens = frozenset(requested & known_screens) if requested else None
+        
+        self._window = None
+        if time_from and time_to:
+            self._window = (time_from.hour * 60 + time_from.minute, time_to.hour * 60 + time_to.minute)
+
+    @property
+    def film_needle(self):
+        """Normalized film filter, or None when every film matches"""
+        return self._film_needle
+
+    def matches_film(self, film_name):
+        if self._film_needle is None:
+            return True
+        result = self._film_results.get(film_name)
+        if result is None:
+            result = self._film_results[film_name] = self._film_needle in normalize_film_name(film_name)
+        return result
+
+    def matches_show(self, screen_name, show_time_str):
+        if self.screens is not None and normalize_screen_name(screen_name) not in self.screens:
+            return False
+        if self._window is None:
+            return True
+        minute = show_minute(show_time_str)
+        if minute is None:
+            return True  # Unparseable times are considered in range, as in is_time_in_range
+        start, end = self._window
+        if start <= end:
+            return start <= minute <= end
+        return minute >= start or minute <= end  # Window wraps past midnight
+
+# === Persistence ===
+def _identity_to_key(identity):
+    return json.dumps(identity)
+
+def _identity_from_key(key):
+    identity = json.loads(key)
+    return tuple(identity) if isinstance(identity, list) else identity
+
+class WatchStore:
+    """SQLite (WAL) store for watch definitions, target snapshots and sent alerts.
+
+    Writes are queued and committed in batches by a background thread so the
+    polling loop never waits on disk. An empty WATCH_DB_PATH disables it.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS watches (
+            id TEXT PRIMARY KEY,
+            definition TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS snapshots (
+            cid TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            states TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (cid, dated)
+        );
+        CREATE TABLE IF NOT EXISTS alerts (
+            job_id TEXT NOT NULL,
+            cinema TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            sent_at TEXT NOT NULL,
+            PRIMARY KEY (job_id, cinema, dated, identity)
+        );
+        CREATE TABLE IF NOT EXISTS seat_series (
+            cid TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            film TEXT NOT NULL,
+            screen TEXT NOT NULL,
+            show_time TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            times BLOB NOT NULL,
+            seats BLOB NOT NULL,
+            PRIMARY KEY (cid, dated, identity)
+        );
+        CREATE TABLE IF NOT EXISTS seat_chunks (
+            id INTEGER PRIMARY KEY,
+            cid TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            times BLOB NOT NULL,
+            seats BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS seat_chunks_series ON seat_chunks (cid, dated, identity);
+        CREATE TABLE IF NOT EXISTS seat_alerts (
+            job_id TEXT NOT NULL,
+            rule TEXT NOT NULL,
+            cinema TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            PRIMARY KEY (job_id, rule, cinema, dated, identity)
+        );
+    """
+    # Version 1 keyed alerts by (job_id, cinema) when a watch had a single date
+    SCHEMA_VERSION = 2
+    MIGRATE_V1_ALERTS = """
+        ALTER TABLE alerts RENAME TO alerts_v1;
+        CREATE TABLE alerts (
+            job_id TEXT NOT NULL,
+            cinema TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            sent_at TEXT NOT NULL,
+            PRIMARY KEY (job_id, cinema, dated, identity)
+        );
+        INSERT INTO alerts (job_id, cinema, dated, identity, sent_at)
+            SELECT a.job_id, a.cinema, json_extract(w.definition, '$.date'), a.identity, a.sent_at
+            FROM alerts_v1 a JOIN watches w ON w.id = a.job_id;
+        DROP TABLE alerts_v1;
+    """
+
+    def __init__(self, path=WATCH_DB_PATH):
+        self.path = path
+        self.enabled = bool(path)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        if self.enabled:
+            with closing(self._connect()) as conn:
+                self._migrate(conn)
+                conn.executescript(self.SCHEMA)
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self, conn):
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(alerts)")]
+        if columns and 'dated' not in columns:
+            conn.executescript(self.MIGRATE_V1_ALERTS)
+
+    def _submit(self, op):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="watch-store", daemon=True)
+                self._thread.start()
+        self._queue.put(op)
+
+    def save_watch(self, job):
+        definition = dict(job.to_dict(), chat_id=job.chat_id)
+        self._submit(('save_watch', job.id, json.dumps(definition), definition['created_at']))
+
+    def delete_watch(self, job_id):
+        self._submit(('delete_watch', job_id))
+
+    def save_snapshot(self, key, states):
+        """Queue the latest show states for a target; states must not be mutated afterwards"""
+        self._submit(('save_snapshot', key, states))
+
+    def record_alerts(self, job_id, cinema, selected_date, identities):
+        self._submit(('record_alerts', job_id, cinema, selected_date, list(identities)))
+
+    def record_seat_alert(self, job_id, key):
+        """key is a WatchJob.seat_alerted entry: (rule, cinema, dated, identity)"""
+        self._submit(('record_seat_alert', job_id, key))
+
+    def clear_seat_alert(self, job_id, key):
+        self._submit(('clear_seat_alert', job_id, key))
+
+    def load_seat_alerts(self):
+        """Fired seat rules by job_id, as sets of (rule, cinema, dated, identity)"""
+        if not self.enabled:
+            return {}
+        seat_alerts = {}
+        with closing(self._connect()) as conn:
+            for job_id, rule, cinema, dated, identity in conn.execute("SELECT job_id, rule, cinema, dated, identity FROM seat_alerts"):
+                seat_alerts.setdefault(job_id, set()).add((rule, cinema, dated, _identity_from_key(identity)))
+        return seat_alerts
+
+    def save_series(self, rows):
+        """Queue whole seat series, replacing any stored samples: (cid, dated, identity key, film, screen, show_time, total, times, seats)"""
+        self._submit(('save_series', rows))
+
+    def append_series(self, chunks):
+        """Queue samples to add to stored seat series: (cid, dated, identity key, total, times, seats)"""
+        self._submit(('append_series', chunks))
+
+    def prune_series(self, oldest_date):
+        self._submit(('prune_series', oldest_date))
+
+    def load_series(self):
+        """Seat series rows as save_series takes them, with appended chunks folded in"""
+        if not self.enabled:
+            return []
+        with closing(self._connect()) as conn:
+            series = {row[:3]: [*row[:7], [row[7]], [row[8]]]
+                      for row in conn.execute("SELECT cid, dated, identity, film, screen, show_time, total, times, seats FROM seat_series")}
+            for cid, dated, identity, total, times, seats in conn.execute(
+                    "SELECT cid, dated, identity, total, times, seats FROM seat_chunks ORDER BY id"):
+                row = series.get((cid, dated, identity))
+                if row is not None:
+                    row[6] = total
+                    row[7].append(times)
+                    row[8].append(seats)
+        return [(*row[:7], b"".join(row[7]), b"".join(row[8])) for row in series.values()]
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + STORE_FLUSH_INTERVAL
+            while len(batch) < 500:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._apply(conn, batch)
+            except sqlite3.Error as e:
+                log_message(f"⚠️ Failed to persist {len(batch)} change(s): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _apply(self, conn, batch):
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        snapshots = {}  # only the newest snapshot per target is worth writing
+        with conn:
+            for op in batch:
+                kind = op[0]
+                if kind == 'save_watch':
+                    conn.execute("INSERT OR REPLACE INTO watches (id, definition, created_at) VALUES (?, ?, ?)", op[1:])
+                elif kind == 'delete_watch':
+                    conn.execute("DELETE FROM watches WHERE id = ?", (op[1],))
+                    conn.execute("DELETE FROM alerts WHERE job_id = ?", (op[1],))
+                    conn.execute("DELETE FROM seat_alerts WHERE job_id = ?", (op[1],))
+                elif kind == 'save_snapshot':
+                    snapshots[op[1]] = op[2]
+                elif kind == 'save_series':
+                    conn.executemany("INSERT OR REPLACE INTO seat_series (cid, dated, identity, film, screen, show_time, total, times, seats) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", op[1])
+                    conn.executemany("DELETE FROM seat_chunks WHERE cid = ? AND dated = ? AND identity = ?", [row[:3] for row in op[1]])
+                elif kind == 'append_series':
+                    conn.executemany("INSERT INTO seat_chunks (cid, dated, identity, total, times, seats) VALUES (?, ?, ?, ?, ?, ?)", op[1])
+                elif kind in ('record_seat_alert', 'clear_seat_alert'):
+                    _, job_id, (rule, cinema, dated, identity) = op
+                    row = (job_id, rule, cinema, dated, _identity_to_key(identity))
+                    if kind == 'record_seat_alert':
+                        conn.execute("INSERT OR IGNORE INTO seat_alerts (job_id, rule, cinema, dated, identity) VALUES (?, ?, ?, ?, ?)", row)
+                    else:
+                        conn.execute("DELETE FROM seat_alerts WHERE job_id = ? AND rule = ? AND cinema = ? AND dated = ? AND identity = ?", row)
+                elif kind == 'prune_series':
+                    conn.execute("DELETE FROM seat_series WHERE dated < ?", (op[1],))
+                    conn.execute("DELETE FROM seat_chunks WHERE dated < ?", (op[1],))
+                elif kind == 'record_alerts':
+                    _, job_id, cinema, dated, identities = op
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO alerts (job_id, cinema, dated, identity, sent_at) VALUES (?, ?, ?, ?, ?)",
+                        [(job_id, cinema, dated, _identity_to_key(identity), now) for identity in identities]
+                    )
+            for (cid, dated), states in snapshots.items():
+                encoded = json.dumps([[identity, list(state)] for identity, state in states.items()])
+                conn.execute("INSERT OR REPLACE INTO snapshots (cid, dated, states, updated_at) VALUES (?, ?, ?, ?)",
+                             (cid, dated, encoded, now))
+
+    def flush(self, timeout=5):
+        """Block until queued writes are committed (used at shutdown)"""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def load(self):
+        """Read everything back: (watch definitions, snapshots by target, alerts by (job_id, cinema, dated))"""
+        if not self.enabled:
+            return [], {}, {}
+        with closing(self._connect()) as conn:
+            watches = [json.loads(row[0]) for row in conn.execute("SELECT definition FROM watches ORDER BY created_at")]
+            snapshots = {}
+            for cid, dated, encoded in conn.execute("SELECT cid, dated, states FROM snapshots"):
+                snapshots[(cid, dated)] = {
+                    (tuple(identity) if isinstance(identity, list) else identity): tuple(state)
+                    for identity, state in json.loads(encoded)
+                }
+            alerts = {}
+            for job_id, cinema, dated, identity in conn.execute("SELECT job_id, cinema, dated, identity FROM alerts"):
+                alerts.setdefault((job_id, cinema, dated), set()).add(_identity_from_key(identity))
+        return watches, snapshots, alerts
+
+
+store = WatchStore()
+restored_snapshots = {}  # (cid, dated) -> states loaded at startup, consumed by the first poller
+
+def restore_watches():
+    """Rehydrate persisted watches and resume polling without re-sending old alerts"""
+    try:
+        watches, snapshots, alerts = store.load()
+    except sqlite3.Error as e:
+        log_message(f"⚠️ Could not load saved watches: {e}")
+        return 0
+    restored_snapshots.update(snapshots)
+    seat_alerts = store.load_seat_alerts()
     
-    while not alert_sent_map.get(cinema_name) and not monitoring_flag.is_set():
+    restored = 0
+    for definition in watches:
         try:
-            log_message(f"⏳ Checking {cinema_name}...")
-            sessions = check_booking(cinema_id, selected_date)
-            found = False
-            show_details = []
-            
-            for session in sessions:
-                movie = session.get("movieRe", {})
-                film_name = movie.get("filmName", "")
-                if film_name_filter and film_name_filter.lower() not in film_name.lower():
+            job = parse_watch_request(definition, job_id=definition['id'])
+        except WatchExpired:
+            log_message(f"🗓️ Dropping saved watch {definition['id']}: all of its dates have passed", job_id=definition['id'])
+            store.delete_watch(definition['id'])
+            continue
+        except (ValueError, KeyError) as e:
+            log_message(f"⚠️ Skipping saved watch {definition.get('id')}: {e}")
+            continue
+        job.created_at = datetime.datetime.fromisoformat(definition['created_at'])
+        job.alerts_sent = definition.get('alerts_sent', 0)
+        # Not primed: the first poll re-checks open shows, so matches whose alert was
+        # never delivered before the restart are sent; delivered ones are in alerted
+        for cinema, dated in job.alerted:
+            job.alerted[(cinema, dated)] = alerts.get((job.id, cinema, dated), set())
+        job.seat_alerted = {key for key in seat_alerts.get(job.id, ()) if key[1:3] in job.alerted}
+        start_watch(job, persist=False)
+        restored += 1
+    
+    for key in list(restored_snapshots):
+        if not registry.subscribers(key):
+            del restored_snapshots[key]
+    if restored:
+        log_message(f"♻️ Restored {restored} saved watch(es)")
+    return restored
+
+# === Seat Availability History ===
+class SeatSeries:
+    """Available seats for one show over time, as two parallel compact arrays"""
+    __slots__ = ("film", "screen", "time", "total", "times", "seats", "thinned", "saved")
+
+    def __init__(self, film, screen, show_time, total, times=None, seats=None):
+        self.film = film
+        self.screen = screen
+        self.time = show_time
+        self.total = total
+        self.times = times if times is not None else array('I')  # epoch seconds
+        self.seats = seats if seats is not None else array('H')  # available seats from that time on
+        self.thinned = 0  # leading samples already thinned to one per bucket
+        self.saved = 0    # leading samples already in the store
+
+    def value_at(self, timestamp):
+        """Available seats at a time, or None before the first sample"""
+        index = bisect.bisect_right(self.times, timestamp) - 1
+        return self.seats[index] if index >= 0 else None
+
+    def downsample(self, before, bucket):
+        """Keep one sample (the last) per bucket for samples older than before.
+
+        Only samples past the thinned mark are scanned; the last thinned one is
+        rechecked since newer samples may share its bucket.
+        """
+        cut = bisect.bisect_left(self.times, before)
+        start = max(self.thinned - 1, 0)
+        if cut - start < 2:
+            self.thinned = max(self.thinned, cut)
+            return False
+        times, seats = self.times[:start], self.seats[:start]
+        for index in range(start, cut):
+            if index + 1 < cut and self.times[index] // bucket == self.times[index + 1] // bucket:
+                continue
+            times.append(self.times[index])
+            seats.append(self.seats[index])
+        self.thinned = len(times)
+        if len(times) == cut:
+            return False
+        times.extend(self.times[cut:])
+        seats.extend(self.seats[cut:])
+        self.times, self.seats = times, seats
+        return True
+
+class SeatHistory:
+    """Per-show seat availability over time, kept column-wise and indexed by cinema and film."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.series = {}     # (cid, dated, identity) -> SeatSeries
+        self._by_cinema = {}  # cid -> set of series keys
+        self._by_film = {}    # film name -> set of series keys
+        self._dirty = set()    # series with samples the store doesn't have yet
+        self._rewrite = set()  # series thinned since they were stored, so stored samples are stale
+        self._thread = None
+
+    def _index(self, series_key, series):
+        self._by_cinema.setdefault(series_key[0], set()).add(series_key)
+        self._by_film.setdefault(series.film, set()).add(series_key)
+
+    def record(self, key, records, now=None):
+        """Append samples for shows whose seat count moved; returns [(record, before, after)]"""
+        self.start()
+        now = int(now or time.time())
+        cinema_id, selected_date = key
+        transitions = []
+        with self._lock:
+            for record in records:
+                seats = record.seats
+                if seats is None:
                     continue
-                
-                for exp in session.get("experienceSessions", []):
-                    for show in exp.get("shows", []):
-                        screen_name = show.get("screenName", "")
-                        show_time_str = show.get("showTime", "")
-                        subtitle = show.get("subtitle", False)
-                        
-                        if screen_name_filters and screen_name not in screen_name_filters:
-                            continue
-                        
-                        show_time = parse_time_12h(show_time_str) if show_time_str else None
-                        if time_from and time_to and show_time:
-                            if not is_time_in_range(show_time, time_from, to_time):
-                                continue
-                        
-                        show_details.append({
-                            "movie": film_name,
-                            "screen": screen_name,
-                            "time": show_time_str,
-                            "subtitle": "Yes" if subtitle else "No",
-                            "booking_link": f"https://www.pvrcinemas.com/cinemasessions/Chennai/qr/{cinema_id}"
-                        })
-                        found = True
-            
-            if found and show_details:
-                show_lines = []
-                for show in show_details:
-                    show_lines.append(
-                        f"<b>{show['movie']}</b><br>"
-                        f"• Screen: {show['screen']}<br>"
-                        f"• Time: {show['time']}<br>"
-                        f"• Subtitles: {show['subtitle']}<br>"
-                    )
-                show_details_msg = "<br>".join(show_lines)
-                
-                telegram_msg = (
-                    f"<b>🎬 Booking is OPEN!</b><br><br>"
-                    f"<b>📅 Date:</b> {selected_date}<br>"
-                    f"<b>🏢 PVR:</b> {cinema_name}, Chennai<br>"
-                )
-                
-                if film_name_filter:
-                    telegram_msg += f"<br><b>🎥 Filtered Film:</b> {film_name_filter}"
-                if screen_name_filters:
-                    telegram_msg += f"<br><b>📺 Screens:</b> {', '.join(screen_name_filters)}"
-                if time_from and time_to:
-                    telegram_msg += f"<br><b>⏰ Show Time:</b> {time_from.strftime('%I:%M %p')} - {time_to.strftime('%I:%M %p')}"
-                
-                telegram_msg += f"<br><br><b>🎭 Matching Shows:</b><br>{show_details_msg}"
-                telegram_msg += f"<br><br><a href='https://www.pvrcinemas.com/cinemasessions/Chennai/qr/{cinema_id}'>🎟️ Book Now</a>"
-                
-                if send_telegram(telegram_msg):
-                    alert_sent_map[cinema_name] = True
-                    log_message(f"✅ Booking is open for {cinema_name}!")
-                    
-                    socketio.emit('booking_found', {
-                        'cinema': cinema_name,
-                        'shows': show_details,
-                        'date': selected_date
-                    })
-                    return
-            else:
-                log_message(f"🚫 No matching shows at {cinema_name}")
-            
-            time.sleep(CHECK_INTERVAL)
-            
-        except Exception as e:
-            log_message(f"⚠️ Error in monitoring thread for {cinema_name}: {str(e)}")
-            time.sleep(10)  # Wait before retrying after an error
+                available, total = seats
+                series_key = (cinema_id, selected_date, record.identity)
+                series = self.series.get(series_key)
+                if series is None:
+                    series = self.series[series_key] = SeatSeries(record.film, record.screen, record.time, total)
+                    self._index(series_key, series)
+                before = series.seats[-1] if series.seats else None
+                if before == available:
+                    continue
+                series.times.append(now)
+                series.seats.append(min(available, 65535))
+                series.total = total
+                self._dirty.add(series_key)
+                transitions.append((record, before, available))
+        return transitions
 
-@app.route('/')
-def index():
-    return render_template('index.html', 
-                         cinemas=CINEMA_CODES.keys(),
-                         theatre_screens=THEATRE_SCREENS,
-                         today=datetime.date.today().strftime("%Y-%m-%d"))
+    def start(self):
+        """Start the flush thread on first use"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="seat-history", daemon=True)
+                self._thread.start()
 
-@app.route('/start_monitoring', methods=['POST'])
-def start_monitoring():
-    global monitoring_flag, monitoring_threads
+    def _run(self):
+        while True:
+            time.sleep(SEAT_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                log_message(f"⚠️ Seat history flush failed: {e}")
+
+    def flush(self):
+        """Thin old samples, drop expired shows and queue changed series for the store"""
+        oldest_date = (datetime.date.today() - datetime.timedelta(days=SEAT_HISTORY_DAYS)).isoformat()
+        thin_before = int(time.time()) - SEAT_DOWNSAMPLE_AFTER
+        rows, chunks = [], []
+        with self._lock:
+            for series_key in [series_key for series_key in self.series if series_key[1] < oldest_date]:
+                self._drop(series_key)
+            series_keys = list(self.series)
+        # Take the lock per series so record() never waits behind a full pass
+        for series_key in series_keys:
+            with self._lock:
+                series = self.series.get(series_key)
+                if series is not None and series.downsample(thin_before, SEAT_DOWNSAMPLE_BUCKET):
+                    self._rewrite.add(series_key)
+        # New samples are appended; only new or thinned series are written whole
+        with self._lock:
+            for series_key in self._dirty | self._rewrite:
+                series = self.series.get(series_key)
+                if series is None:
+                    continue
+                cinema_id, dated, identity = series_key
+                stored_key = (cinema_id, dated, _identity_to_key(identity))
+                if series_key in self._rewrite or not series.saved:
+                    rows.append(stored_key + (series.film, series.screen, series.time, series.total,
+                                              series.times.tobytes(), series.seats.tobytes()))
+                elif len(series.times) > series.saved:
+                    chunks.append(stored_key + (series.total, series.times[series.saved:].tobytes(), series.seats[series.saved:].tobytes()))
+                series.saved = len(series.times)
+            self._dirty.clear()
+            self._rewrite.clear()
+        if rows:
+            store.save_series(rows)
+        if chunks:
+            store.append_series(chunks)
+        store.prune_series(oldest_date)
+
+    def _drop(self, series_key):
+        series = self.series.pop(series_key)
+        self._by_cinema.get(series_key[0], set()).discard(series_key)
+        self._by_film.get(series.film, set()).discard(series_key)
+        self._dirty.discard(series_key)
+        self._rewrite.discard(series_key)
+
+    def load(self, rows):
+        with self._lock:
+            for cinema_id, dated, identity, film, screen, show_time, total, times, seats in rows:
+                series = SeatSeries(sys.intern(film), sys.intern(screen), sys.intern(show_time), total, array('I'), array('H'))
+                series.times.frombytes(times)
+                series.seats.frombytes(seats)
+                series.saved = len(series.times)
+                series_key = (cinema_id, dated, _identity_from_key(identity))
+                self.series[series_key] = series
+                self._index(series_key, series)
+        return len(rows)
+
+    def _select(self, cinema_id=None, film=None, dated=None):
+        """Series keys matching the filters; film is a case-insensitive substring"""
+        if cinema_id is not None:
+            keys = set(self._by_cinema.get(cinema_id, ()))
+        else:
+            keys = set(self.series)
+        if film:
+            needle = normalize_film_name(film)
+            film_keys = set()
+            for film_name, series_keys in self._by_film.items():
+                if needle in normalize_film_name(film_name):
+                    film_keys.update(series_keys)
+            keys &= film_keys
+        if dated:
+            keys = {series_key for series_key in keys if series_key[1] == dated}
+        return keys
+
+    def fill_curve(self, cinema_id=None, film=None, dated=None, start=None, end=None, step=3600):
+        """Fill rate (sold / total seats) over time across the matching shows.
+
+        Each show contributes from its first sample on, with its last known
+        count carried forward between samples.
+        """
+        end = int(end or time.time())
+        # Copy the samples so pollers are only held up for the copy, not the sweep
+        with self._lock:
+            selected = [(series.times[:], series.seats[:], series.total)
+                        for series in (self.series[series_key] for series_key in self._select(cinema_id, film, dated))]
+        if start is None:
+            start = min((times[0] for times, _, _ in selected if times), default=end)
+        start = int(start)
+        steps = max(int((end - start) // step) + 1, 1)
+        if steps > SEAT_FILL_MAX_POINTS:
+            raise ValueError(f"{steps} points requested; use a larger step or a shorter range (at most {SEAT_FILL_MAX_POINTS})")
+        # Each sample adds its change in sold seats (and a show's first sample its
+        # capacity) at the first step it covers; a running sum gives every point
+        sold = [0] * steps
+        capacity = [0] * steps
+        for times, seats, total in selected:
+            first = max(bisect.bisect_right(times, start) - 1, 0)  # earlier samples are superseded by start
+            previous = 0
+            for index in range(first, len(times)):
+                position = max(-(-(times[index] - start) // step), 0)
+                if position >= steps:
+                    break
+                value = total - min(seats[index], total)
+                sold[position] += value - previous
+                if index == first:
+                    capacity[position] += total
+                previous = value
+        points = []
+        sold_total = capacity_total = 0
+        for position in range(steps):
+            sold_total += sold[position]
+            capacity_total += capacity[position]
+            if capacity_total:
+                points.append([start + position * step, round(sold_total / capacity_total, 4)])
+        return {'shows': len(selected), 'start': start, 'end': end, 'step': step, 'points': points}
+
+    def show_summaries(self, cinema_id=None, film=None, dated=None, limit=100):
+        """Latest availability per matching show, fullest first"""
+        with self._lock:
+            summaries = []
+            for series_key in self._select(cinema_id, film, dated):
+                series = self.series[series_key]
+                if not series.seats:
+                    continue
+                available = series.seats[-1]
+                summaries.append({
+                    'cinema': CINEMA_NAMES.get(series_key[0], series_key[0]),
+                    'date': series_key[1],
+                    'film': series.film,
+                    'screen': series.screen,
+                    'time': series.time,
+                    'available': available,
+                    'total': series.total,
+                    'fill': round(1 - min(available, series.total) / series.total, 4),
+                    'samples': len(series.seats),
+                    'first_seen': series.times[0],
+                    'last_change': series.times[-1]
+                })
+        summaries.sort(key=lambda summary: summary['fill'], reverse=True)
+        return summaries[:limit]
+
+    def stats(self):
+        with self._lock:
+            samples = sum(len(series.times) for series in self.series.values())
+            return {'shows': len(self.series), 'samples': samples, 'bytes': samples * 6, 'films': len(self._by_film)}
+
+
+seat_history = SeatHistory()
+
+# === Watch Registry ===
+class WatchExpired(ValueError):
+    """Every date a watch asked for is already in the past"""
+
+class WatchJob:
+    """One user's watch: cinemas, one or more dates, compiled filters and per-target alert state"""
+
+    def __init__(self, cinemas, dates, film_name_filter="", screen_name_filters=(), time_from=None, time_to=None, chat_id=None, job_id=None,
+                 seats_below=None, notify_restock=False):
+        self.id = job_id or uuid.uuid4().hex[:8]
+        self.cinemas = list(cinemas)
+        self.dates = sorted(dates)
+        self.film_name_filter = film_name_filter
+        self.screen_name_filters = list(screen_name_filters)
+        self.time_from = time_from
+        self.time_to = time_to
+        self.chat_id = chat_id
+        self.seats_below = seats_below        # alert once a matching show has fewer seats left than this
+        self.notify_restock = notify_restock  # alert when a sold-out matching show gets seats back
+        self.status = 'active'
+        self.created_at = datetime.datetime.now()
+        self.alerts_sent = 0
+        self.filters = {cinema: WatchFilter(cinema, film_name_filter, screen_name_filters, time_from, time_to) for cinema in self.cinemas}
+        # Alert state is per (cinema, date), since show identities can repeat across days
+        self.alerted = {(cinema, dated): set() for cinema in self.cinemas for dated in self.dates}  # identities already alerted
+        self.pending = {(cinema, dated): {} for cinema in self.cinemas for dated in self.dates}     # identity -> show details awaiting a send
+        self.sending = {(cinema, dated): set() for cinema in self.cinemas for dated in self.dates}  # identities queued, not yet delivered
+        self.alert_lock = threading.Lock()  # the notifier thread settles sends while pollers dispatch
+        self.primed = set()  # (cinema, date) pairs whose already-open shows have been checked once
+        self.seat_alerted = set()  # (rule, cinema, date, identity) already alerted; restock re-arms on sell-out
+        self.seat_pending = {}     # (rule, cinema, date, identity) -> (record, before, after) awaiting a send
+        self.seat_sending = set()  # (rule, cinema, date, identity) queued, not yet delivered
+
+    @property
+    def date(self):
+        """Nearest date still watched"""
+        return self.dates[0]
+
+    def targets(self):
+        return [(CINEMA_CODES[cinema], dated) for dated in self.dates for cinema in self.cinemas]
+
+    def drop_date(self, dated):
+        """Forget a date's alert state; the caller keeps the registry index in step"""
+        with self.alert_lock:
+            self.dates.remove(dated)
+            for cinema in self.cinemas:
+                self.alerted.pop((cinema, dated), None)
+                self.pending.pop((cinema, dated), None)
+                self.sending.pop((cinema, dated), None)
+                self.primed.discard((cinema, dated))
+            self.seat_alerted.difference_update([key for key in self.seat_alerted if key[2] == dated])
+            self.seat_sending.difference_update([key for key in self.seat_sending if key[2] == dated])
+            for key in [key for key in self.seat_pending if key[2] == dated]:
+                del self.seat_pending[key]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'cinemas': self.cinemas,
+            'date': self.date,
+            'dates': self.dates,
+            'film_name': self.film_name_filter,
+            'screens': self.screen_name_filters,
+            'time_from': self.time_from.strftime('%I:%M %p') if self.time_from else '',
+            'time_to': self.time_to.strftime('%I:%M %p') if self.time_to else '',
+            'seats_below': self.seats_below,
+            'notify_restock': self.notify_restock,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(timespec='seconds'),
+            'alerts_sent': self.alerts_sent
+        }
+
+class WatchRegistry:
+    """Watch jobs by ID plus an index from (cid, dated) target to subscribed jobs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {}
+        self._by_target = {}  # (cid, dated) -> {job_id: job}
+
+    def add(self, job):
+        with self._lock:
+            self.jobs[job.id] = job
+            for key in job.targets():
+                self._by_target.setdefault(key, {})[job.id] = job
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                return None
+            for key in job.targets():
+                subscribers = self._by_target.get(key, {})
+                subscribers.pop(job_id, None)
+                if not subscribers:
+                    self._by_target.pop(key, None)
+            return job
+
+    def drop_date(self, job, dated):
+        """Stop routing a date's targets to a job and drop the date from it"""
+        with self._lock:
+            for cinema in job.cinemas:
+                key = (CINEMA_CODES[cinema], dated)
+                subscribers = self._by_target.get(key, {})
+                subscribers.pop(job.id, None)
+                if not subscribers:
+                    self._by_target.pop(key, None)
+            job.drop_date(dated)
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def subscribers(self, key):
+        with self._lock:
+            return list(self._by_target.get(key, {}).values())
+
+    def film_needles(self, key):
+        """Film needles covering every job on a target, or None when any job takes all films"""
+        needles = set()
+        for job in self.subscribers(key):
+            needle = job.filters[CINEMA_NAMES[key[0]]].film_needle
+            if needle is None:
+                return None
+            needles.add(needle)
+        return frozenset(needles) if needles else None
+
+    def target_count(self):
+        with self._lock:
+            return len(self._by_target)
+
+
+registry = WatchRegistry()
+
+def start_watch(job, persist=True):
+    """Register a job and make sure each of its targets has a poller"""
+    registry.add(job)
+    if persist:
+        store.save_watch(job)
+    if coordinator is not None:
+        coordinator.targets_changed()
+        return
+    for cinema_id, dated in job.targets():
+        engine.ensure((cinema_id, dated), monitor_cinema, CINEMA_NAMES[cinema_id], cinema_id, dated)
+
+def stop_watch(job_id, persist=True):
+    """Unregister a job; pollers left without subscribers are cancelled right away"""
+    job = registry.remove(job_id)
+    if job is not None:
+        job.status = 'stopped'
+        if persist:
+            store.delete_watch(job_id)
+        if coordinator is not None:
+            coordinator.targets_changed()
+            return job
+        for key in job.targets():
+            engine.call(_cancel_if_orphaned, key)
+    return job
+
+def _cancel_if_orphaned(key):
+    if not registry.subscribers(key):
+        engine.cancel(key)
+
+def expire_past_dates():
+    """Drop dates that have passed from every watch and stop watches with none left"""
+    expired = []
+    for job in registry.list():
+        past = [dated for dated in job.dates if date_passed(dated)]
+        if not past:
+            continue
+        if len(past) == len(job.dates):
+            stop_watch(job.id)
+            job.status = 'expired'
+            expired.append(job)
+            log_message(f"🗓️ Watch {job.id} finished: all of its dates have passed", job_id=job.id)
+            continue
+        for dated in past:
+            registry.drop_date(job, dated)
+        store.save_watch(job)
+        if coordinator is not None:
+            coordinator.targets_changed()
+        log_message(f"🗓️ Watch {job.id} no longer polls {', '.join(past)}", job_id=job.id)
+    return expired
+
+WATCH_DATE_FIELDS = {'date', 'dates', 'date_from', 'date_to'}
+
+def _parse_watch_date(value):
+    try:
+        return datetime.datetime.strptime(value.strip(), "%Y-%m-%d").date()
+    except (AttributeError, ValueError):
+        raise ValueError('Invalid date format. Use YYYY-MM-DD')
+
+def parse_watch_dates(data, today=None):
+    """Dates from 'dates', a 'date_from'/'date_to' range or a single 'date'.
+
+    Returns sorted, unique ISO dates with days before today removed; raises
+    ValueError (WatchExpired when only past days were given).
+    """
+    if data.get('dates'):
+        dates = data['dates']
+        if isinstance(dates, str):
+            dates = dates.split(',')
+        days = {_parse_watch_date(dated) for dated in dates}
+    elif data.get('date_from') or data.get('date_to'):
+        if not data.get('date_from') or not data.get('date_to'):
+            raise ValueError('A date range needs both date_from and date_to')
+        start = _parse_watch_date(data['date_from'])
+        end = _parse_watch_date(data['date_to'])
+        if end < start:
+            raise ValueError('date_to must not be before date_from')
+        if (end - start).days >= MAX_WATCH_DATES:
+            raise ValueError(f'A watch can cover at most {MAX_WATCH_DATES} dates')
+        days = {start + datetime.timedelta(days=offset) for offset in range((end - start).days + 1)}
+    elif data.get('date'):
+        days = {_parse_watch_date(data['date'])}
+    else:
+        raise ValueError('Please select a date')
     
-    data = request.json
+    if len(days) > MAX_WATCH_DATES:
+        raise ValueError(f'A watch can cover at most {MAX_WATCH_DATES} dates')
+    today = today or datetime.date.today()
+    upcoming = sorted(day.isoformat() for day in days if day >= today)
+    if not upcoming:
+        raise WatchExpired('All selected dates are in the past')
+    return upcoming
+
+def parse_watch_request(data, job_id=None, today=None):
+    """Validate a watch payload and build a WatchJob; raises ValueError with a user-facing message
+
+    today overrides the cutoff for past dates, for replaying old captures.
+    """
     selected_cinemas = data.get('cinemas', [])
-    selected_date = data.get('date')
     film_name_filter = data.get('film_name', '').strip()
     screen_name_filters = data.get('screens', [])
     time_from_str = data.get('time_from', '').strip()
     time_to_str = data.get('time_to', '').strip()
     
-    # Validate inputs
     if not selected_cinemas:
-        return jsonify({'error': 'Please select at least one cinema'}), 400
+        raise ValueError('Please select at least one cinema')
     
-    if not selected_date:
-        return jsonify({'error': 'Please select a date'}), 400
-    
-    try:
-        datetime.datetime.strptime(selected_date, "%Y-%m-%d")
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    selected_dates = parse_watch_dates(data, today)
     
     time_from = time_to = None
     if time_from_str and time_to_str:
+        time_from = parse_time_12h(time_from_str)
+        time_to = parse_time_12h(time_to_str)
+        if not time_from or not time_to:
+            raise ValueError('Invalid time format. Use format like 04:00 PM')
+    
+    for cinema in selected_cinemas:
+        if cinema not in CINEMA_CODES:
+            raise ValueError(f'Invalid cinema selected: {cinema}')
+    
+    seats_below = data.get('seats_below')
+    if seats_below in ('', None):
+        seats_below = None
+    else:
         try:
-            time_from = parse_time_12h(time_from_str)
-            time_to = parse_time_12h(time_to_str)
-            if not time_from or not time_to:
-                return jsonify({'error': 'Invalid time format. Use format like 04:00 PM'}), 400
-        except Exception as e:
-            return jsonify({'error': f'Invalid time format: {str(e)}. Use format like 04:00 PM'}), 400
+            seats_below = int(seats_below)
+        except (TypeError, ValueError):
+            raise ValueError('seats_below must be a whole number of seats')
+        if seats_below < 1:
+            raise ValueError('seats_below must be at least 1')
     
-    # Clear previous monitoring
-    monitoring_flag.clear()
-    alert_sent_map.clear()
-    monitoring_threads.clear()
+    job = WatchJob(selected_cinemas, selected_dates, film_name_filter, screen_name_filters, time_from, time_to,
+                   chat_id=data.get('chat_id') or None, job_id=job_id,
+                   seats_below=seats_below, notify_restock=bool(data.get('notify_restock')))
+    if screen_name_filters and not any(watch_filter.screens for watch_filter in job.filters.values()):
+        raise ValueError(f"None of the selected screens exist at the selected cinemas: {', '.join(screen_name_filters)}")
+    return job
+
+def format_booking_alert(watch_filter, cinema_name, cinema_id, selected_date, show_details):
+    show_lines = []
+    for show in show_details:
+        show_lines.append(
+            f"<b>{show['movie']}</b><br>"
+            f"• Screen: {show['screen']}<br>"
+            f"• Time: {show['time']}<br>"
+            f"• Subtitles: {show['subtitle']}<br>"
+        )
+    show_details_msg = "<br>".join(show_lines)
     
-    log_message(f"✅ Starting monitoring for {', '.join(selected_cinemas)} on {selected_date}")
+    telegram_msg = (
+        f"<b>🎬 Booking is OPEN!</b><br><br>"
+        f"<b>📅 Date:</b> {selected_date}<br>"
+        f"<b>🏢 PVR:</b> {cinema_name}, {catalog.entry(cinema_id)['city']}<br>"
+    )
     
-    # Start monitoring threads
-    for cinema in selected_cinemas:
-        if cinema not in CINEMA_CODES:
-            return jsonify({'error': f'Invalid cinema selected: {cinema}'}), 400
+    if watch_filter.film_name_filter:
+        telegram_msg += f"<br><b>🎥 Filtered Film:</b> {watch_filter.film_name_filter}"
+    if watch_filter.screen_name_filters:
+        telegram_msg += f"<br><b>📺 Screens:</b> {', '.join(watch_filter.screen_name_filters)}"
+    if watch_filter.time_from and watch_filter.time_to:
+        telegram_msg += f"<br><b>⏰ Show Time:</b> {watch_filter.time_from.strftime('%I:%M %p')} - {watch_filter.time_to.strftime('%I:%M %p')}"
+    
+    telegram_msg += f"<br><br><b>🎭 Matching Shows:</b><br>{show_details_msg}"
+    telegram_msg += f"<br><br><a href='{catalog.booking_link(cinema_id)}'>🎟️ Book Now</a>"
+    return telegram_msg
+
+def dispatch_matches(job, cinema_name, cinema_id, selected_date, snapshot, new_shows, removed_shows):
+    """Match one target's diff against one job and alert on shows it hasn't been told about.
+
+    Shows count as alerted only once Telegram takes the message (see
+    settle_alert); until then they are skipped, and if the send fails they go
+    back to pending for the next poll. Returns True when the job had matching
+    shows, whether or not the alert could be queued.
+    """
+    target = (cinema_name, selected_date)
+    booking_link = catalog.booking_link(cinema_id)
+    with job.alert_lock:
+        alerted = job.alerted.get(target)
+        if alerted is None:
+            return False  # the date was dropped from the job while this poll was in flight
+        watch_filter = job.filters[cinema_name]
+        pending = job.pending[target]
+        sending = job.sending[target]
+        for identity in removed_shows:
+            pending.pop(identity, None)
         
-        cinema_id = CINEMA_CODES[cinema]
-        alert_sent_map[cinema] = False
-        thread = threading.Thread(
-            target=monitor_cinema,
-            args=(cinema, cinema_id, selected_date, film_name_filter, screen_name_filters, time_from, time_to),
-            daemon=True
-        )
-        thread.start()
-        monitoring_threads.append(thread)
+        # A job that just joined a running target still needs to see shows that are already open
+        if target in job.primed:
+            candidates = new_shows
+        else:
+            candidates = snapshot.current_shows()
+            job.primed.add(target)
+        
+        for show in candidates:
+            if show.identity in alerted or show.identity in sending or not watch_filter.matches_film(show.film):
+                continue
+            if not watch_filter.matches_show(show.screen, show.time):
+                continue
+            
+            pending[show.identity] = {
+                "movie": show.film,
+                "screen": show.screen,
+                "time": show.time,
+                "subtitle": "Yes" if show.subtitle else "No",
+                "booking_link": booking_link
+            }
+        
+        if not pending:
+            return False
+        batch = dict(pending)
+        pending.clear()
+        sending.update(batch)
+    
+    show_details = list(batch.values())
+    telegram_msg = format_booking_alert(watch_filter, cinema_name, cinema_id, selected_date, show_details)
+    on_done = functools.partial(settle_alert, job, cinema_name, selected_date, batch)
+    if notifier.enqueue(telegram_msg, job.chat_id, merge=True, on_done=on_done):
+        log_message(f"✅ Booking is open for {cinema_name} on {selected_date}! (watch {job.id})", cinema=cinema_name, job_id=job.id)
+        
+        socket_emit('booking_found', {
+            'cinema': cinema_name,
+            'shows': show_details,
+            'date': selected_date,
+            'job_id': job.id
+        }, to=list(record_rooms(cinema_name, job.id)))
+    else:
+        settle_alert(job, cinema_name, selected_date, batch, False)
+    return True
+
+def settle_alert(job, cinema_name, selected_date, batch, delivered):
+    """Notifier callback for a booking alert: record delivered shows, put undelivered ones back in pending"""
+    target = (cinema_name, selected_date)
+    with job.alert_lock:
+        sending = job.sending.get(target)
+        if sending is None:
+            return  # the date was dropped while the message was in flight
+        sending.difference_update(batch)
+        if delivered:
+            job.alerted[target].update(batch)
+            job.alerts_sent += 1
+        else:
+            for identity, details in batch.items():
+                job.pending[target].setdefault(identity, details)
+    if not delivered:
+        log_message(f"⚠️ Alert for {len(batch)} show(s) at {cinema_name} on {selected_date} was not delivered; retrying on the next poll",
+                    cinema=cinema_name, job_id=job.id)
+    elif registry.get(job.id) is not None:
+        store.record_alerts(job.id, cinema_name, selected_date, batch)
+
+def dispatch_seat_alerts(job, cinema_name, cinema_id, selected_date, transitions):
+    """Check seat-count moves against a job's seat rules and alert on the ones that fire.
+
+    As with booking alerts, a rule counts as fired only once Telegram takes the
+    message (see settle_seat_alert); undelivered ones are retried on the next poll.
+    """
+    watch_filter = job.filters[cinema_name]
+    with job.alert_lock:
+        if (cinema_name, selected_date) not in job.alerted:
+            return False  # the date was dropped from the job while this poll was in flight
+        for record, before, after in transitions:
+            if not watch_filter.matches_film(record.film) or not watch_filter.matches_show(record.screen, record.time):
+                continue
+            target = (cinema_name, selected_date, record.identity)
+            low, restock = ('low',) + target, ('restock',) + target
+            if job.seats_below and after < job.seats_below and low not in job.seat_alerted and low not in job.seat_sending:
+                job.seat_pending[low] = (record, before, after)
+            if job.notify_restock:
+                if after == 0:
+                    job.seat_pending.pop(restock, None)
+                    if restock in job.seat_alerted:
+                        job.seat_alerted.discard(restock)  # re-arm for the next time seats come back
+                        store.clear_seat_alert(job.id, restock)
+                elif before == 0 and restock not in job.seat_alerted and restock not in job.seat_sending:
+                    job.seat_pending[restock] = (record, before, after)
+        batch = {key: fired for key, fired in job.seat_pending.items() if key[1:3] == (cinema_name, selected_date)}
+        if not batch:
+            return False
+        for key in batch:
+            del job.seat_pending[key]
+        job.seat_sending.update(batch)
+    
+    fired = [(key[0],) + details for key, details in batch.items()]
+    lines = []
+    for rule, record, before, after in fired:
+        headline = "🪑 Only a few seats left" if rule == 'low' else "♻️ Seats available again"
+        lines.append(f"{headline}: <b>{record.film}</b><br>• Screen: {record.screen}<br>• Time: {record.time}<br>• Seats left: {after}<br>")
+    telegram_msg = (
+        f"<b>🎟️ Seat update</b><br><br>"
+        f"<b>📅 Date:</b> {selected_date}<br>"
+        f"<b>🏢 PVR:</b> {cinema_name}, {catalog.entry(cinema_id)['city']}<br><br>"
+        + "<br>".join(lines)
+        + f"<br><a href='{catalog.booking_link(cinema_id)}'>🎟️ Book Now</a>"
+    )
+    on_done = functools.partial(settle_seat_alert, job, cinema_name, selected_date, batch)
+    if not notifier.enqueue(telegram_msg, job.chat_id, merge=True, on_done=on_done):
+        settle_seat_alert(job, cinema_name, selected_date, batch, False)
+        return True
+    log_message(f"🪑 {len(fired)} seat alert(s) for {cinema_name} on {selected_date} (watch {job.id})", cinema=cinema_name, job_id=job.id)
+    socket_emit('seat_alert', {
+        'cinema': cinema_name,
+        'date': selected_date,
+        'job_id': job.id,
+        'alerts': [{'rule': rule, 'film': record.film, 'screen': record.screen, 'time': record.time, 'before': before, 'available': after}
+                   for rule, record, before, after in fired]
+    }, to=list(record_rooms(cinema_name, job.id)))
+    return True
+
+def settle_seat_alert(job, cinema_name, selected_date, batch, delivered):
+    """Notifier callback for a seat alert: record delivered rules, put undelivered ones back in pending"""
+    with job.alert_lock:
+        job.seat_sending.difference_update(batch)
+        if (cinema_name, selected_date) not in job.alerted:
+            return  # the date was dropped while the message was in flight
+        if delivered:
+            job.seat_alerted.update(batch)
+        else:
+            for key, details in batch.items():
+                job.seat_pending.setdefault(key, details)
+    if not delivered:
+        log_message(f"⚠️ Seat alert for {len(batch)} show(s) at {cinema_name} on {selected_date} was not delivered; retrying on the next poll",
+                    cinema=cinema_name, job_id=job.id)
+    elif registry.get(job.id) is not None:
+        for key in batch:
+            store.record_seat_alert(job.id, key)
+
+async def sleep_until_next_poll(key):
+    delay = scheduler.next_delay(key)
+    due = time.monotonic() + delay
+    await asyncio.sleep(delay)
+    poll_lag.observe(max(time.monotonic() - due, 0))
+
+def fan_out(key, cinema_name, snapshot, new_shows, removed_shows, changed_shows=(), now=None):
+    """Record seat moves and match one target's diff against every subscribed job; True if any job had matches"""
+    cinema_id, selected_date = key
+    transitions = seat_history.record(key, itertools.chain(new_shows, changed_shows), now)
+    matched = False
+    # Read subscribers now: jobs may have joined or left while the fetch was in flight
+    for job in registry.subscribers(key):
+        eval_start = time.perf_counter()
+        if dispatch_matches(job, cinema_name, cinema_id, selected_date, snapshot, new_shows, removed_shows):
+            matched = True
+        if (transitions or job.seat_pending) and (job.seats_below or job.notify_restock):
+            dispatch_seat_alerts(job, cinema_name, cinema_id, selected_date, transitions)
+        filter_eval.observe(time.perf_counter() - eval_start)
+    return matched
+
+def target_wanted(key):
+    """Whether this process should keep polling a target"""
+    if cluster_worker is not None:
+        return key in cluster_worker.owned
+    return bool(registry.subscribers(key))
+
+async def monitor_cinema(cinema_name, cinema_id, selected_date):
+    """Poll one (cinema, date) target and fan each diff out to every subscribed job.
+
+    In worker mode the diff is reported to the coordinator instead, which owns
+    the jobs and does the matching and alerting.
+    """
+    log_message(f"🔍 Starting monitoring for {cinema_name} on {selected_date}", cinema=cinema_name)
+    key = (cinema_id, selected_date)
+    snapshot = ShowSnapshot(restored_snapshots.pop(key, None), registry.film_needles(key))
+    reported = False
+    await asyncio.sleep(scheduler.initial_delay())
+    
+    try:
+        while target_wanted(key):
+            if date_passed(selected_date):
+                log_message(f"🗓️ {selected_date} has passed, stopping checks for {cinema_name}", cinema=cinema_name)
+                if cluster_worker is None:
+                    expire_past_dates()
+                break
+            try:
+                log_message(f"⏳ Checking {cinema_name}...", cinema=cinema_name)
+                films = registry.film_needles(key)
+                sessions = await fetch_sessions(cinema_id, selected_date, fresh=True, films=films)
+                boot.mark('first_poll')
+                first_poll = snapshot.polls == 0
+                refiltered = films != snapshot.films
+                new_shows, removed_shows, changed_shows = snapshot.diff(sessions, films)
+                
+                if not first_poll and (new_shows or removed_shows or changed_shows):
+                    scheduler.mark_changed(key)
+                    log_message(f"🔄 {cinema_name}: {len(new_shows)} new, {len(removed_shows)} removed, {len(changed_shows)} changed show(s)", cinema=cinema_name)
+                if first_poll or refiltered or new_shows or removed_shows or changed_shows:
+                    store.save_snapshot(key, snapshot.states)
+                
+                changed_records = [snapshot.shows[identity] for identity in changed_shows]
+                if cluster_worker is not None:
+                    # The first report after taking a target over carries every show so the coordinator's mirror is complete
+                    if not reported:
+                        cluster_worker.report(key, snapshot.current_shows(), [], full=True)
+                        reported = True
+                    elif new_shows or removed_shows or changed_records:
+                        cluster_worker.report(key, new_shows, removed_shows, changed_records)
+                elif not fan_out(key, cinema_name, snapshot, new_shows, removed_shows, changed_records):
+                    log_message(f"🚫 No new matching shows at {cinema_name}", cinema=cinema_name)
+                
+                await sleep_until_next_poll(key)
+                
+            except UpstreamUnavailable:
+                # The breaker already logged the outage; wait for it rather than piling on retries
+                await asyncio.sleep(max(breaker.retry_in(), scheduler.next_delay(key)) + random.uniform(0, POLL_STAGGER))
+            except FetchFailed:
+                # No answer is not an empty answer: keep the snapshot as it was and back off
+                await sleep_until_next_poll(key)
+            except Exception as e:
+                log_message(f"⚠️ Error in monitoring task for {cinema_name}: {str(e)}", cinema=cinema_name)
+                scheduler.record_failure(key)
+                await sleep_until_next_poll(key)  # Back off before retrying after an error
+    finally:
+        scheduler.forget(key)
+
+# === Cluster Mode ===
+# PVR_ROLE=coordinator keeps the watch registry, Telegram and SocketIO in the web
+# process; PVR_ROLE=worker processes poll the targets they hold leases on and
+# report diffs back. Both sides meet in the SQLite file at WATCH_DB_PATH.
+def rendezvous_owner(key, workers):
+    """Worker that should own a target: highest hash of (worker, target) wins.
+
+    A worker joining or leaving only moves the targets that hash to it.
+    """
+    if not workers:
+        return None
+    target = f"{key[0]}@{key[1]}"
+    return max(workers, key=lambda worker: hashlib.blake2b(f"{worker}|{target}".encode(), digest_size=8).digest())
+
+class ClusterStore:
+    """Shared tables for cluster mode: wanted targets, worker heartbeats, target leases and reported events"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cluster_targets (
+            cid TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            PRIMARY KEY (cid, dated)
+        );
+        CREATE TABLE IF NOT EXISTS cluster_workers (
+            id TEXT PRIMARY KEY,
+            heartbeat_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS cluster_leases (
+            cid TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            worker_id TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (cid, dated)
+        );
+        CREATE TABLE IF NOT EXISTS cluster_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            cid TEXT NOT NULL,
+            dated TEXT NOT NULL,
+            worker_id TEXT NOT NULL,
+            payload TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path=WATCH_DB_PATH):
+        if not path:
+            raise RuntimeError("Cluster mode needs WATCH_DB_PATH to point at a database shared by all processes")
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def set_targets(self, keys):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cluster_targets")
+            self._conn.executemany("INSERT INTO cluster_targets (cid, dated) VALUES (?, ?)", keys)
+
+    def targets(self):
+        with self._lock:
+            return {tuple(row) for row in self._conn.execute("SELECT cid, dated FROM cluster_targets")}
+
+    def live_workers(self, now):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM cluster_workers WHERE heartbeat_at >= ?", (now - LEASE_TTL,))]
+
+    def claim(self, worker_id, wanted, now):
+        """Heartbeat, release leases no longer wanted and take wanted ones that are free, expired or ours.
+
+        Returns the set of targets this worker now holds.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO cluster_workers (id, heartbeat_at) VALUES (?, ?)", (worker_id, now))
+            self._conn.execute("DELETE FROM cluster_workers WHERE heartbeat_at < ?", (now - 10 * LEASE_TTL,))
+            held = {tuple(row) for row in self._conn.execute("SELECT cid, dated FROM cluster_leases WHERE worker_id = ?", (worker_id,))}
+            self._conn.executemany("DELETE FROM cluster_leases WHERE cid = ? AND dated = ? AND worker_id = ?",
+                                   [(cid, dated, worker_id) for cid, dated in held - wanted])
+            self._conn.executemany(
+                "INSERT INTO cluster_leases (cid, dated, worker_id, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (cid, dated) DO UPDATE SET worker_id = excluded.worker_id, expires_at = excluded.expires_at "
+                "WHERE cluster_leases.worker_id = excluded.worker_id OR cluster_leases.expires_at < ?",
+                [(cid, dated, worker_id, now + LEASE_TTL, now) for cid, dated in wanted]
+            )
+            return {tuple(row) for row in self._conn.execute("SELECT cid, dated FROM cluster_leases WHERE worker_id = ?", (worker_id,))}
+
+    def leave(self, worker_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cluster_leases WHERE worker_id = ?", (worker_id,))
+            self._conn.execute("DELETE FROM cluster_workers WHERE id = ?", (worker_id,))
+
+    def add_events(self, worker_id, events):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO cluster_events (cid, dated, worker_id, payload) VALUES (?, ?, ?, ?)",
+                                   [(cid, dated, worker_id, payload) for (cid, dated), payload in events])
+
+    def events_after(self, seq, limit=500):
+        with self._lock:
+            return self._conn.execute("SELECT seq, cid, dated, payload FROM cluster_events WHERE seq > ? ORDER BY seq LIMIT ?",
+                                      (seq, limit)).fetchall()
+
+    def trim_events(self, seq):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cluster_events WHERE seq <= ?", (seq,))
+
+    def overview(self, now):
+        with self._lock:
+            workers = {worker_id: {'heartbeat_age': round(now - heartbeat_at, 1), 'leases': 0}
+                       for worker_id, heartbeat_at in self._conn.execute("SELECT id, heartbeat_at FROM cluster_workers")}
+            for worker_id, count in self._conn.execute("SELECT worker_id, COUNT(*) FROM cluster_leases WHERE expires_at >= ? GROUP BY worker_id", (now,)):
+                workers.setdefault(worker_id, {'heartbeat_age': None, 'leases': 0})['leases'] = count
+            pending_events = self._conn.execute("SELECT COUNT(*) FROM cluster_events").fetchone()[0]
+        return {'workers': workers, 'pending_events': pending_events}
+
+def _encode_shows(shows):
+    return [[_identity_to_key(record.identity), record.to_list()] for record in shows]
+
+def _decode_shows(shows):
+    return [ShowRecord.from_list(_identity_from_key(identity), values) for identity, values in shows]
+
+class ClusterWorker:
+    """Worker side: leases targets by rendezvous hash and reports each target's diffs.
+
+    Leases keep two workers from polling the same target while membership
+    settles; a worker that stops heartbeating loses its leases after LEASE_TTL.
+    """
+
+    def __init__(self, cluster, worker_id=WORKER_ID):
+        self.cluster = cluster
+        self.id = worker_id
+        self.owned = set()
+        self._events = queue.Queue()
+        self.reported = 0
+
+    def report(self, key, new_shows, removed_shows, changed_shows=(), full=False):
+        """Queue a diff for the coordinator; safe to call from the engine loop"""
+        payload = json.dumps({
+            'new': _encode_shows(new_shows),
+            'removed': [_identity_to_key(identity) for identity in removed_shows],
+            'changed': _encode_shows(changed_shows),
+            'full': full
+        })
+        self._events.put((key, payload))
+
+    def sync(self):
+        now = time.time()
+        workers = set(self.cluster.live_workers(now)) | {self.id}
+        wanted = {key for key in self.cluster.targets() if rendezvous_owner(key, workers) == self.id}
+        held = self.cluster.claim(self.id, wanted, now)
+        for key in held - self.owned:
+            cinema_id, dated = key
+            engine.ensure(key, monitor_cinema, CINEMA_NAMES.get(cinema_id, cinema_id), cinema_id, dated)
+        for key in self.owned - held:
+            engine.call(engine.cancel, key)
+        if held != self.owned:
+            log_message(f"📦 Worker {self.id} now holds {len(held)} target(s) ({len(workers)} live worker(s))")
+        self.owned = held
+
+    def flush(self):
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+        if events:
+            self.cluster.add_events(self.id, events)
+            self.reported += len(events)
+
+    def run(self):
+        """Block forever: renew leases every CLUSTER_HEARTBEAT and ship events every CLUSTER_EVENT_POLL"""
+        log_message(f"🛠️ Worker {self.id} joining the cluster")
+        next_sync = 0
+        try:
+            while True:
+                if time.monotonic() >= next_sync:
+                    try:
+                        self.sync()
+                    except sqlite3.Error as e:
+                        log_message(f"⚠️ Worker {self.id} could not renew leases: {e}")
+                    next_sync = time.monotonic() + CLUSTER_HEARTBEAT
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    log_message(f"⚠️ Worker {self.id} could not report events: {e}")
+                time.sleep(CLUSTER_EVENT_POLL)
+        finally:
+            self.flush()
+            self.cluster.leave(self.id)
+            log_message(f"👋 Worker {self.id} left the cluster")
+
+class ClusterCoordinator:
+    """Web-tier side: publishes the registry's targets and applies workers' diffs to local jobs"""
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.mirrors = {}  # (cid, dated) -> ShowSnapshot rebuilt from reported diffs
+        self.last_seq = 0
+        self.applied = 0
+        self.skipped = 0
+        self._dirty = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._dirty.set()
+            self._thread = threading.Thread(target=self._run, name="cluster-coordinator", daemon=True)
+            self._thread.start()
+
+    def targets_changed(self):
+        """Republish the target set on the next loop; cheap to call from request handlers"""
+        self._dirty.set()
+
+    def _run(self):
+        next_expiry = 0
+        while True:
+            try:
+                if self._dirty.is_set():
+                    self._dirty.clear()
+                    self.cluster.set_targets(list({key for job in registry.list() for key in job.targets()}))
+                self.apply_events()
+                if time.monotonic() >= next_expiry:
+                    expire_past_dates()
+                    for key in [key for key in self.mirrors if not registry.subscribers(key)]:
+                        del self.mirrors[key]
+                    next_expiry = time.monotonic() + 60
+            except sqlite3.Error as e:
+                log_message(f"⚠️ Coordinator could not sync with workers: {e}")
+            except Exception as e:
+                # Keep the thread alive: without it no targets are published and no events applied
+                log_message(f"⚠️ Coordinator loop error: {e}")
+            time.sleep(CLUSTER_EVENT_POLL)
+
+    def apply_events(self):
+        rows = self.cluster.events_after(self.last_seq)
+        for seq, cinema_id, dated, payload in rows:
+            key = (cinema_id, dated)
+            cinema_name = CINEMA_NAMES.get(cinema_id, cinema_id)
+            # Decode fully before touching the mirror, and step past events that don't decode
+            try:
+                event = json.loads(payload)
+                reported = (_decode_shows(event['new']), [_identity_from_key(identity) for identity in event['removed']],
+                            _decode_shows(event.get('changed', [])), bool(event['full']))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                log_message(f"⚠️ Skipping malformed worker event {seq} for {cinema_name}: {e!r}", cinema=cinema_name)
+                self.last_seq = seq
+                self.skipped += 1
+                continue
+            snapshot = self.mirrors.setdefault(key, ShowSnapshot())
+            new_shows, removed_shows, changed_shows = snapshot.apply(*reported)
+            try:
+                fan_out(key, cinema_name, snapshot, new_shows, removed_shows, changed_shows)
+            except Exception as e:
+                log_message(f"⚠️ Error applying worker event for {cinema_name}: {e}", cinema=cinema_name)
+            self.last_seq = seq
+            self.applied += 1
+        if rows:
+            self.cluster.trim_events(self.last_seq)
+
+    def stats(self):
+        return dict(self.cluster.overview(time.time()), role='coordinator', applied_events=self.applied,
+                    skipped_events=self.skipped, mirrored_targets=len(self.mirrors))
+
+coordinator = None      # set when PVR_ROLE=coordinator
+cluster_worker = None   # set when PVR_ROLE=worker
+
+def run_worker():
+    """Entry point for PVR_ROLE=worker: poll leased targets until terminated"""
+    global cluster_worker
+    _, snapshots, _ = store.load()
+    restored_snapshots.update(snapshots)
+    cluster_worker = ClusterWorker(ClusterStore())
+    # Turn SIGTERM into a normal exit so leases are released right away
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        cluster_worker.run()
+    except KeyboardInterrupt:
+        pass
+
+# === csessions Capture and Replay ===
+class CaptureLog:
+    """Segmented on-disk log of raw, zlib-compressed csessions responses, written by a background thread."""
+
+    FRAME = struct.Struct(">II")
+    QUEUE_SIZE = 512
+
+    def __init__(self, directory=CAPTURE_DIR, segment_bytes=CAPTURE_SEGMENT_BYTES, max_segments=CAPTURE_MAX_SEGMENTS):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.counters = {'recorded': 0, 'dropped': 0, 'raw_bytes': 0, 'stored_bytes': 0, 'segments': 0}
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._segment = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+                self._thread.start()
+
+    def record(self, cinema_id, selected_date, body):
+        """Queue one raw response body; safe to call from the engine loop"""
+        self.start()
+        try:
+            self._queue.put_nowait((time.time(), cinema_id, selected_date, body))
+        except queue.Full:
+            self.counters['dropped'] += 1
+
+    def flush(self):
+        """Block until every queued response is on disk"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+                if self._queue.empty():
+                    self._segment.flush()
+            except OSError as e:
+                self.counters['dropped'] += 1
+                log_message(f"⚠️ Capture write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, recorded_at, cinema_id, selected_date, body):
+        header = json.dumps({'cid': cinema_id, 'dated': selected_date, 'ts': recorded_at}, separators=(',', ':')).encode()
+        payload = zlib.compress(body, 6)
+        if self._segment is None or self._segment.tell() >= self.segment_bytes:
+            self._roll(recorded_at)
+        self._segment.write(self.FRAME.pack(len(header), len(payload)) + header + payload)
+        self.counters['recorded'] += 1
+        self.counters['raw_bytes'] += len(body)
+        self.counters['stored_bytes'] += len(payload) + len(header) + self.FRAME.size
+
+    def _roll(self, recorded_at):
+        if self._segment is not None:
+            self._segment.close()
+        self.counters['segments'] += 1
+        name = f"capture-{int(recorded_at * 1000):013d}-{self.counters['segments']:06d}.seg"
+        self._segment = open(os.path.join(self.directory, name), "ab")
+        segments = capture_segments(self.directory)
+        if self.max_segments > 0:
+            for stale in segments[:-self.max_segments]:
+                os.remove(stale)
+
+    def stats(self):
+        stats = dict(self.counters, enabled=self.enabled, queued=self._queue.qsize())
+        stats['compression_ratio'] = round(stats['raw_bytes'] / stats['stored_bytes'], 2) if stats['stored_bytes'] else None
+        return stats
+
+
+capture = CaptureLog()
+
+def capture_segments(source):
+    """Segment files for a capture directory (oldest first) or a single segment path"""
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source))
+                if name.startswith("capture-") and name.endswith(".seg")]
+    return [source]
+
+def _capture_frames(source, payloads=True):
+    """Yield (ts, cid, dated, compressed payload) in recording order; payload is None when payloads is False.
+
+    A frame cut short by a crash ends its segment with a warning.
+    """
+    frame = CaptureLog.FRAME
+    for path in capture_segments(source):
+        with open(path, "rb") as segment:
+            while True:
+                prefix = segment.read(frame.size)
+                if not prefix:
+                    break
+                header_len, payload_len = frame.unpack(prefix) if len(prefix) == frame.size else (0, 0)
+                header = segment.read(header_len)
+                if payloads:
+                    payload = segment.read(payload_len)
+                    complete = len(payload) == payload_len
+                else:
+                    payload = None
+                    complete = segment.seek(payload_len, os.SEEK_CUR) <= os.fstat(segment.fileno()).st_size
+                if not header_len or len(header) < header_len or not complete:
+                    logging.warning(f"⚠️ Truncated frame at the end of {path}")
+                    break
+                meta = json.loads(header)
+                yield meta['ts'], meta['cid'], meta['dated'], payload
+
+def read_capture(source):
+    """Yield (ts, cid, dated, body) with each recorded csessions body decompressed"""
+    for recorded_at, cinema_id, selected_date, payload in _capture_frames(source):
+        yield recorded_at, cinema_id, selected_date, zlib.decompress(payload)
+
+class CaptureReplay:
+    """Feed a recorded capture through the same parse, diff and alert path as monitor_cinema.
+
+    Uses this process's registry and notifier, so run it with PVR_ROLE=replay (see benchmarks/replay_capture.py).
+    """
+
+    STAGES = ('decompress', 'parse', 'diff', 'alert')
+
+    def __init__(self, source, watches=None, speed=0.0):
+        self.source = source
+        self.watches = watches
+        self.speed = speed
+
+    def _register_watches(self, targets, first_day):
+        jobs = []
+        if self.watches:
+            for definition in self.watches:
+                jobs.append(parse_watch_request(definition, today=first_day))
+        else:
+            for cinema_id, dated in sorted(targets):
+                if cinema_id in CINEMA_NAMES:
+                    jobs.append(WatchJob([CINEMA_NAMES[cinema_id]], [dated], chat_id="replay"))
+        for job in jobs:
+            registry.add(job)
+        return jobs
+
+    def run(self):
+        headers = list(_capture_frames(self.source, payloads=False))
+        if not headers:
+            raise ValueError(f"No recorded responses in {self.source}")
+        targets = {(cinema_id, dated) for _, cinema_id, dated, _ in headers}
+        first_day = datetime.date.fromtimestamp(headers[0][0])
+        jobs = self._register_watches(targets, first_day)
+        alerts = notifier.captured = []
+        
+        snapshots = {}
+        costs = {stage: [] for stage in self.STAGES}
+        skipped = errors = raw_bytes = 0
+        previous_ts = None
+        started = time.perf_counter()
+        try:
+            for recorded_at, cinema_id, selected_date, payload in _capture_frames(self.source):
+                if self.speed and previous_ts is not None:
+                    time.sleep(max(recorded_at - previous_ts, 0) / self.speed)
+                previous_ts = recorded_at
+                key = (cinema_id, selected_date)
+                cinema_name = CINEMA_NAMES.get(cinema_id)
+                if cinema_name is None or not registry.subscribers(key):
+                    skipped += 1
+                    continue
+                
+                stage_start = time.perf_counter()
+                body = zlib.decompress(payload)
+                parse_start = time.perf_counter()
+                films = registry.film_needles(key)
+                try:
+                    sessions = parse_sessions(body, film_matcher(films))
+                except ValueError:
+                    errors += 1
+                    continue
+                diff_start = time.perf_counter()
+                snapshot = snapshots.get(key)
+                if snapshot is None:
+                    snapshot = snapshots[key] = ShowSnapshot(films=films)
+                new_shows, removed_shows, changed_shows = snapshot.diff(sessions, films)
+                alert_start = time.perf_counter()
+                fan_out(key, cinema_name, snapshot, new_shows, removed_shows,
+                        [snapshot.shows[identity] for identity in changed_shows], now=recorded_at)
+                done = time.perf_counter()
+                
+                raw_bytes += len(body)
+                costs['decompress'].append(parse_start - stage_start)
+                costs['parse'].append(diff_start - parse_start)
+                costs['diff'].append(alert_start - diff_start)
+                costs['alert'].append(done - alert_start)
+        finally:
+            notifier.captured = None
+            for job in jobs:
+                registry.remove(job.id)
+        
+        elapsed = time.perf_counter() - started
+        replayed = len(costs['parse'])
+        span = headers[-1][0] - headers[0][0]
+        digest = hashlib.sha256()
+        for chat_id, msg in alerts:
+            digest.update(f"{chat_id}\0{msg}\0".encode())
+        return {
+            'responses': len(headers),
+            'replayed': replayed,
+            'skipped': skipped,
+            'errors': errors,
+            'targets': len(targets),
+            'watches': len(jobs),
+            'raw_bytes': raw_bytes,
+            'recorded_span_s': round(span, 3),
+            'replay_s': round(elapsed, 3),
+            'speedup': round(span / elapsed, 1) if elapsed and span else None,
+            'per_payload_ms': {stage: _cost_summary(samples) for stage, samples in costs.items()},
+            'total_per_payload_ms': _cost_summary([sum(parts) for parts in zip(*costs.values())]),
+            'alerts': len(alerts),
+            'alerts_digest': digest.hexdigest(),
+            'alert_messages': alerts
+        }
+
+def _cost_summary(samples):
+    """mean/p50/p95/max in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda pct: ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)]
+    return {
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50': round(pick(50) * 1000, 3),
+        'p95': round(pick(95) * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3)
+    }
+
+@functools.lru_cache(maxsize=64)
+def _render_cached(view, arg, version, today):
+    """(etag, body) for a catalog-backed response; the key changes whenever its content can"""
+    if view == 'index':
+        body = render_template('index.html',
+                               cinemas=list(CINEMA_CODES),
+                               theatre_screens=THEATRE_SCREENS,
+                               today=today)
+    else:
+        body = json.dumps({'success': True, 'cinema': arg, 'screens': THEATRE_SCREENS[arg]})
+    return hashlib.blake2b(body.encode(), digest_size=8).hexdigest(), body
+
+def cached_response(view, arg=None, mimetype='text/html'):
+    """Serve a rendered page from memory with an ETag, answering 304 when the client's copy is current"""
+    etag, body = _render_cached(view, arg, catalog.version, datetime.date.today().strftime("%Y-%m-%d"))
+    response = make_response(body)
+    response.mimetype = mimetype
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/')
+def index():
+    return cached_response('index')
+
+@app.route('/watches', methods=['POST'])
+@app.route('/start_monitoring', methods=['POST'])
+def start_monitoring():
+    try:
+        job = parse_watch_request(request.json or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    log_message(f"✅ Starting monitoring for {', '.join(job.cinemas)} on {', '.join(job.dates)} (watch {job.id})", job_id=job.id)
+    for cinema, watch_filter in job.filters.items():
+        if watch_filter.screens is not None and not watch_filter.screens:
+            log_message(f"⚠️ None of the selected screens exist at {cinema}, so it will never match", cinema=cinema, job_id=job.id)
+    start_watch(job)
     
     # Send startup notification if Telegram is configured
-    if BOT_TOKEN and CHAT_ID:
+    if BOT_TOKEN and (job.chat_id or CHAT_ID):
         telegram_msg = (
             f"<b>🔔 Monitoring Started!</b><br><br>"
-            f"<b>🏢 Theatres:</b> {', '.join(selected_cinemas)}<br>"
-            f"<b>📅 Date:</b> {selected_date}<br>"
+            f"<b>🏢 Theatres:</b> {', '.join(job.cinemas)}<br>"
+            f"<b>📅 Date{'s' if len(job.dates) > 1 else ''}:</b> {', '.join(job.dates)}<br>"
         )
-        if film_name_filter:
-            telegram_msg += f"<b>🎥 Film Filter:</b> {film_name_filter}<br>"
-        if screen_name_filters:
-            telegram_msg += f"<b>📺 Screen Filter:</b> {', '.join(screen_name_filters)}<br>"
-        if time_from and time_to:
-            telegram_msg += f"<b>⏰ Time Range:</b> {time_from.strftime('%I:%M %p')} - {time_to.strftime('%I:%M %p')}<br>"
-        telegram_msg += f"<br>Will check every {CHECK_INTERVAL} seconds for open bookings."
+        if job.film_name_filter:
+            telegram_msg += f"<b>🎥 Film Filter:</b> {job.film_name_filter}<br>"
+        if job.screen_name_filters:
+            telegram_msg += f"<b>📺 Screen Filter:</b> {', '.join(job.screen_name_filters)}<br>"
+        if job.time_from and job.time_to:
+            telegram_msg += f"<b>⏰ Time Range:</b> {job.time_from.strftime('%I:%M %p')} - {job.time_to.strftime('%I:%M %p')}<br>"
+        telegram_msg += f"<br>Will check about every {CHECK_INTERVAL:g} seconds (faster as the date gets closer) for open bookings."
         
-        send_telegram(telegram_msg)
+        notifier.enqueue(telegram_msg, job.chat_id)
     
     return jsonify({
         'success': True,
-        'message': f'Monitoring started for {len(selected_cinemas)} cinema(s)',
-        'check_interval': CHECK_INTERVAL
+        'message': f'Monitoring started for {len(job.cinemas)} cinema(s) on {len(job.dates)} date(s)',
+        'check_interval': CHECK_INTERVAL,
+        'job_id': job.id,
+        'job': job.to_dict()
     })
 
 @app.route('/stop_monitoring', methods=['POST'])
 def stop_monitoring():
-    global monitoring_flag
-    monitoring_flag.set()
-    log_message("🛑 Monitoring stopped by user request")
+    """Stop one watch when a job_id is given, otherwise every watch"""
+    job_id = (request.get_json(silent=True) or {}).get('job_id')
+    if job_id:
+        job = stop_watch(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Unknown watch ID'}), 404
+        stopped = [job]
+        log_message(f"🛑 Monitoring stopped for watch {job_id} by user request", job_id=job_id)
+    else:
+        stopped = [stop_watch(job.id) for job in registry.list()]
+        stopped = [job for job in stopped if job is not None]
+        log_message("🛑 Monitoring stopped by user request")
     
-    if BOT_TOKEN and CHAT_ID:
-        send_telegram("<b>🔕 Monitoring Stopped</b><br><br>The monitoring service has been stopped manually.")
+    if BOT_TOKEN:
+        for chat_id in {job.chat_id or CHAT_ID for job in stopped} - {None}:
+            notifier.enqueue("<b>🔕 Monitoring Stopped</b><br><br>The monitoring service has been stopped manually.", chat_id)
     
     return jsonify({
         'success': True,
         'message': 'Monitoring stopped',
-        'active_threads': len(monitoring_threads)
+        'stopped_jobs': [job.id for job in stopped],
+        'active_threads': engine.active_count
     })
 
+@app.route('/watches')
+def list_watches():
+    jobs = [job.to_dict() for job in registry.list()]
+    return jsonify({'success': True, 'watches': jobs, 'count': len(jobs)})
+
+@app.route('/watches/<job_id>')
+def get_watch(job_id):
+    job = registry.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown watch ID'}), 404
+    return jsonify({'success': True, 'watch': job.to_dict()})
+
+@app.route('/watches/<job_id>', methods=['PUT'])
+def update_watch(job_id):
+    current = registry.get(job_id)
+    if current is None:
+        return jsonify({'success': False, 'error': 'Unknown watch ID'}), 404
+    changes = request.json or {}
+    base = current.to_dict()
+    if WATCH_DATE_FIELDS & changes.keys():
+        # New dates replace the old ones rather than mixing with them
+        base = {field: value for field, value in base.items() if field not in WATCH_DATE_FIELDS}
+    try:
+        job = parse_watch_request({**base, 'chat_id': current.chat_id, **changes}, job_id=job_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Keep alert history for (cinema, date) targets still watched so nothing re-alerts
+    job.alerts_sent = current.alerts_sent
+    kept = {target: current.alerted[target] for target in job.alerted if target in current.alerted}
+    job.alerted.update(kept)
+    # Sends still in flight settle on the old job; share their state and lock so the new one sees the outcome
+    job.alert_lock = current.alert_lock
+    job.sending.update({target: current.sending[target] for target in kept})
+    job.pending.update({target: current.pending[target] for target in kept})
+    with current.alert_lock:
+        current.seat_alerted.difference_update([key for key in current.seat_alerted if key[1:3] not in kept])
+        current.seat_sending.difference_update([key for key in current.seat_sending if key[1:3] not in kept])
+        for key in [key for key in current.seat_pending if key[1:3] not in kept]:
+            del current.seat_pending[key]
+        job.seat_alerted, job.seat_pending, job.seat_sending = current.seat_alerted, current.seat_pending, current.seat_sending
+        seat_alerted = list(job.seat_alerted)
+    # Rewrite the saved definition; alert history is re-recorded only for targets that remain
+    stop_watch(job_id)
+    start_watch(job)
+    for (cinema, dated), identities in kept.items():
+        if identities:
+            store.record_alerts(job.id, cinema, dated, identities)
+    for key in seat_alerted:
+        store.record_seat_alert(job.id, key)
+    log_message(f"✏️ Watch {job_id} updated", job_id=job_id)
+    return jsonify({'success': True, 'watch': job.to_dict()})
+
+@app.route('/watches/<job_id>', methods=['DELETE'])
+def delete_watch(job_id):
+    job = stop_watch(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown watch ID'}), 404
+    log_message(f"🛑 Monitoring stopped for watch {job_id} by user request", job_id=job_id)
+    return jsonify({'success': True, 'watch': job.to_dict()})
+
 @app.route('/test_telegram', methods=['POST'])
 def test_telegram():
     if not BOT_TOKEN or not CHAT_ID:
@@ -469,21 +3625,33 @@ def test_telegram():
 
 @app.route('/get_logs')
 def get_logs():
+    """Buffered logs; ?since=<seq> returns only newer records, ?limit caps the page size.
+
+    Repeated ?cinemas= and ?job_ids= narrow the records to a live subscription's rooms.
+    """
+    since = log_store.cursor(request.args.get('since', default=0, type=int), request.args.get('epoch'))
+    limit = request.args.get('limit', type=int)
+    rooms = subscription_rooms({'cinemas': request.args.getlist('cinemas'), 'job_ids': request.args.getlist('job_ids')})
+    scanned = log_store.since(since, limit)
+    entries = scanned if ALL_ROOM in rooms else entries_for_rooms(scanned, rooms)
     return jsonify({
         'success': True,
-        'logs': logs,
-        'count': len(logs)
+        'epoch': log_store.epoch,
+        'logs': [entry['text'] for entry in entries],
+        'entries': entries,
+        'count': len(entries),
+        # Past everything scanned, so a filtered page still moves the cursor on
+        'next_seq': scanned[-1]['seq'] if scanned else max(since, log_store.last_seq)
     })
 
 @app.route('/clear_logs', methods=['POST'])
 def clear_logs():
-    global logs
-    logs.clear()
+    log_store.clear()
     log_message("🗑️ Logs cleared by user request")
     return jsonify({
         'success': True,
         'message': 'Logs cleared',
-        'remaining_logs': len(logs)
+        'remaining_logs': len(log_store)
     })
 
 @app.route('/get_screens/<cinema>')
@@ -491,41 +3659,195 @@ def get_screens(cinema):
     if cinema not in THEATRE_SCREENS:
         return jsonify({'success': False, 'error': 'Invalid cinema name'}), 404
     
+    return cached_response('screens', cinema, mimetype='application/json')
+
+@app.route('/analytics/fill')
+def fill_analytics():
+    """Fill-rate curve and per-show availability for a cinema and/or film.
+
+    Query: cinema (name), film (substring), date (show date), from/to (epoch
+    seconds), step (seconds per point, default 3600), limit (shows listed).
+    """
+    cinema = request.args.get('cinema')
+    film = request.args.get('film', '').strip()
+    if cinema and cinema not in CINEMA_CODES:
+        return jsonify({'success': False, 'error': 'Invalid cinema name'}), 404
+    if not cinema and not film:
+        return jsonify({'success': False, 'error': 'Give a cinema, a film or both'}), 400
+    step = request.args.get('step', default=3600, type=int)
+    if step < 60:
+        return jsonify({'success': False, 'error': 'step must be at least 60 seconds'}), 400
+    
+    query_start = time.perf_counter()
+    cinema_id = CINEMA_CODES[cinema] if cinema else None
+    dated = request.args.get('date')
+    try:
+        curve = seat_history.fill_curve(cinema_id, film, dated, request.args.get('from', type=int), request.args.get('to', type=int), step)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    shows = seat_history.show_summaries(cinema_id, film, dated, request.args.get('limit', default=50, type=int))
     return jsonify({
         'success': True,
         'cinema': cinema,
-        'screens': THEATRE_SCREENS[cinema]
+        'film': film or None,
+        'date': dated,
+        'curve': curve,
+        'shows': shows,
+        'query_ms': round((time.perf_counter() - query_start) * 1000, 2)
     })
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: answers as soon as the app can serve requests"""
+    return jsonify({'status': 'ok', 'role': PVR_ROLE, 'uptime': boot.stats()['uptime']})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once saved watches are restored and polling, 503 before that"""
+    ready = boot.reached('restored')
+    return jsonify({'ready': ready, 'role': PVR_ROLE, **boot.stats()}), 200 if ready else 503
+
+async def _upstream_stats():
+    # Breaker and budget live on the engine loop, so read them there
+    return {'breaker': breaker.stats(), 'budget': request_budget.stats()}
+
 @app.route('/status')
 def status():
     return jsonify({
         'status': 'running',
         'telegram_configured': bool(BOT_TOKEN and CHAT_ID),
-        'active_monitoring': not monitoring_flag.is_set(),
-        'monitoring_threads': len(monitoring_threads),
-        'last_logs_count': len(logs),
-        'check_interval': CHECK_INTERVAL
+        'active_monitoring': bool(registry.list()),
+        'monitoring_threads': engine.active_count,
+        'watch_jobs': len(registry.list()),
+        'last_logs_count': len(log_store),
+        'check_interval': CHECK_INTERVAL,
+        'sessions_cache': sessions_cache.stats(),
+        'http_pools': http_metrics.snapshot(),
+        'poll_targets': scheduler.stats(),
+        'notifications': notifier.stats(),
+        'live_updates': broadcaster.stats(),
+        'catalog': catalog.stats(),
+        'seat_history': seat_history.stats(),
+        'boot': boot.stats(),
+        'capture': capture.stats(),
+        'upstream': engine.run(_upstream_stats(), timeout=5) if engine.loop is not None else {'breaker': breaker.stats(), 'budget': None},
+        'cluster': coordinator.stats() if coordinator is not None else {'role': PVR_ROLE}
     })
 
+Gauge('telegram_queue_depth', 'Notifications waiting in the dispatcher queue', lambda: notifier._queue.qsize())
+Gauge('telegram_scheduled_notifications', 'Notifications waiting on rate limits, merging or retries', lambda: len(notifier._scheduled))
+Gauge('pvr_watch_jobs', 'Registered watch jobs', lambda: len(registry.list()))
+Gauge('pvr_active_pollers', 'Running (cinema, date) pollers', lambda: engine.active_count)
+Gauge('socketio_clients', 'Connected SocketIO clients', lambda: broadcaster.clients)
+Gauge('pvr_circuit_open', 'csessions circuit state (0 closed, 1 half-open, 2 open)',
+      lambda: {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[breaker.state])
+Gauge('pvr_request_budget_tokens', 'Tokens left in the csessions request budget', lambda: round(request_budget.tokens, 2))
+Gauge('pvr_sessions_cache_entries', 'Cached csessions responses', lambda: sessions_cache.stats()['cached_targets'])
+
+@app.route('/metrics')
+def metrics():
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def subscription_rooms(data):
+    """Rooms for a subscription payload of job_ids and/or cinemas; nothing specific means 'all'"""
+    data = data or {}
+    rooms = set()
+    for job_id in data.get('job_ids') or []:
+        rooms.add(job_room(job_id))
+        job = registry.get(job_id)
+        if job is not None:
+            # A job's pollers log per cinema, so follow those cinemas too
+            rooms.update(cinema_room(cinema) for cinema in job.cinemas)
+    for cinema in data.get('cinemas') or []:
+        rooms.add(cinema_room(cinema))
+    return rooms or {ALL_ROOM}
+
+def entries_for_rooms(entries, rooms):
+    return [entry for entry in entries if rooms.intersection(record_rooms(entry['cinema'], entry['job_id']))]
+
 @socketio.on('connect')
-def handle_connect():
-    log_message("🔗 New client connected via WebSocket")
-    emit('initial_logs', {'logs': logs})
+def handle_connect(auth=None):
+    # Connects and disconnects go to the server log only, so they don't fan out to every dashboard
+    logging.info("🔗 New client connected via WebSocket")
+    auth = auth or {}
+    rooms = subscription_rooms(auth)
+    broadcaster.connected(request.sid, rooms)
+    # Reconnecting clients pass their last seen seq and only get what they missed;
+    # a cursor from before a server restart starts over
+    since = auth.get('since') or request.args.get('since', default=0, type=int)
+    since = log_store.cursor(int(since), auth.get('epoch'))
+    entries = entries_for_rooms(log_store.since(since), rooms)
+    socketio_emits.inc('initial_logs')
+    emit('initial_logs', {
+        'logs': [entry['text'] for entry in entries],
+        'since': since,
+        'epoch': log_store.epoch,
+        'rooms': sorted(rooms),
+        'next_seq': log_store.last_seq
+    })
+
+@socketio.on('subscribe')
+def handle_subscribe(data=None):
+    """Switch this client to the rooms for the given job_ids/cinemas (or back to 'all')"""
+    rooms = subscription_rooms(data)
+    paused = broadcaster.lagging.get(request.sid)
+    current = set(paused) if paused is not None else set(socketio.server.manager.get_rooms(request.sid, '/')) - {None, request.sid}
+    if paused is not None:
+        broadcaster.lagging[request.sid] = list(rooms)
+    else:
+        for room in current - rooms:
+            leave_room(room)
+        for room in rooms - current:
+            join_room(room)
+    socketio_emits.inc('subscribed')
+    emit('subscribed', {'rooms': sorted(rooms)})
 
 @socketio.on('disconnect')
-def handle_disconnect():
-    log_message("🔌 Client disconnected from WebSocket")
+def handle_disconnect(reason=None):
+    broadcaster.disconnected(request.sid)
+    logging.info("🔌 Client disconnected from WebSocket")
 
-if __name__ == '__main__':
-    log_message("🚀 PVR Booking Monitor Web App started!")
+# === Startup ===
+def boot_in_background(announce=False):
+    """Bring saved state back and warm up without holding back the web server.
+
+    Phases: restored (watches polling again), then first_poll (marked by the
+    monitors), then telegram (credentials checked). announce queues the startup
+    Telegram message once the bot token is verified.
+    """
+    try:
+        seat_history.load(store.load_series())
+        restore_watches()
+        if coordinator is not None:
+            coordinator.start()
+    except Exception as e:
+        boot.fail('restored', e)
+        log_message(f"❌ Restoring saved state failed: {e}")
+    boot.mark('restored')
+    catalog.start()
+    
     log_message(f"Telegram configured: {'✅' if BOT_TOKEN and CHAT_ID else '❌'}")
     if BOT_TOKEN and CHAT_ID:
-        log_message("Testing Telegram connection...")
-        if send_telegram("<b>🔔 PVR Monitor Startup</b><br><br>Service has started successfully!"):
-            log_message("✅ Telegram connection test successful")
+        if verify_bot_token():
+            if announce:
+                notifier.enqueue("<b>🔔 PVR Monitor Startup</b><br><br>Service has started successfully!")
         else:
-            log_message("❌ Telegram connection test failed")
+            boot.fail('telegram', 'bot token check failed')
+    boot.mark('telegram')
+
+if PVR_ROLE == 'coordinator':
+    coordinator = ClusterCoordinator(ClusterStore())
+atexit.register(store.flush)
+atexit.register(capture.flush)
+boot.mark('imported')
+if PVR_ROLE not in ('worker', 'replay'):
+    atexit.register(seat_history.flush)
+    threading.Thread(target=boot_in_background, args=(__name__ == '__main__',), name="boot", daemon=True).start()
+
+if __name__ == '__main__' and PVR_ROLE == 'worker':
+    run_worker()
+elif __name__ == '__main__':
+    log_message("🚀 PVR Booking Monitor Web App started!")
     
     # For local testing only; Render uses gunicorn
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Import pvr_monitor without a watch database, catalog cache or boot thread
+os.environ.setdefault("WATCH_DB_PATH", "")
+os.environ.setdefault("CATALOG_PATH", "")
+os.environ.setdefault("PVR_ROLE", "replay")
+os.environ.setdefault("BOT_TOKEN", "")
+os.environ.setdefault("CHAT_ID", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
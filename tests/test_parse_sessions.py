@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from pvr_monitor import parse_sessions
+
+
+def body(*films):
+    return json.dumps({"result": "success", "output": {"cinemaMovieSessions": list(films)}})
+
+
+def film(name, *shows, experiences=None):
+    return {
+        "movieRe": {"filmName": name},
+        "experienceSessions": experiences if experiences is not None else [{"shows": list(shows)}],
+    }
+
+
+def show(screen="AUDI 1", time="10:00 AM", session_id=None, **state):
+    data = {"screenName": screen, "showTime": time, "ss": 1, "status": "available",
+            "availableSeats": 100, "totalSeats": 120, **state}
+    if session_id:
+        data["sessionId"] = session_id
+    return data
+
+
+def test_parses_shows_of_every_film():
+    records = parse_sessions(body(film("Leo", show(), show(time="01:00 PM")), film("Jawan", show(session_id="s1"))))
+    assert [(r.film, r.screen, r.time) for r in records] == [
+        ("Leo", "AUDI 1", "10:00 AM"), ("Leo", "AUDI 1", "01:00 PM"), ("Jawan", "AUDI 1", "10:00 AM")]
+    assert records[0].identity == ("Leo", "AUDI 1", "10:00 AM")
+    assert records[2].identity == "s1"
+    assert records[0].seats == (100, 120)
+
+
+def test_film_filter_drops_other_films():
+    records = parse_sessions(body(film("Leo", show()), film("Jawan", show())), lambda name: name == "Jawan")
+    assert [r.film for r in records] == ["Jawan"]
+
+
+def test_film_filter_applies_when_sessions_come_before_the_name():
+    entry = {"experienceSessions": [{"shows": [show()]}], "movieRe": {"filmName": "Leo"}}
+    assert parse_sessions(body(entry), lambda name: name == "Jawan") == []
+    assert [r.film for r in parse_sessions(body(entry))] == ["Leo"]
+
+
+def test_null_fields_become_empty():
+    records = parse_sessions(body(film(None, show(screen=None, time=None))))
+    assert [(r.film, r.screen, r.time) for r in records] == [("", "", "")]
+
+
+@pytest.mark.parametrize("experiences", [None, [], [{"shows": None}], [{}], [None, "x", 3], {"shows": []}])
+def test_missing_or_null_sessions_yield_no_shows(experiences):
+    assert parse_sessions(body(film("Leo", experiences=experiences))) == []
+
+
+def test_entries_that_are_not_objects_are_skipped():
+    payload = body(None, "film", film("Leo", None, "show", show()), film("Jawan", experiences=[{"shows": [1, show()]}]))
+    assert [r.film for r in parse_sessions(payload)] == ["Leo", "Jawan"]
+
+
+@pytest.mark.parametrize("payload", [
+    {"output": None},
+    {"output": {"cinemaMovieSessions": None}},
+    {"output": {"cinemaMovieSessions": {}}},
+    {"result": "error"},
+])
+def test_responses_without_sessions_are_empty(payload):
+    assert parse_sessions(json.dumps(payload)) == []
+
+
+def test_bytes_body():
+    assert len(parse_sessions(body(film("Leo", show())).encode())) == 1
+
+
+@pytest.mark.parametrize("payload", ["", "[]", "null", '{"output": {"cinemaMovieSessions": [', "not json", b"\xff\xfe"])
+def test_malformed_bodies_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        parse_sessions(payload)
+
+
+def test_unexpected_value_types_raise_value_error():
+    bad_film_name = {"movieRe": {"filmName": 42}, "experienceSessions": [{"shows": [show()]}]}
+    with pytest.raises(ValueError):
+        parse_sessions(body(bad_film_name))
+    with pytest.raises(ValueError):
+        parse_sessions(body(film("Leo", show(screen=7))))
@@ -0,0 +1,38 @@
+from pvr_monitor import ShowRecord, ShowSnapshot
+
+
+def record(film, time="10:00 AM", seats=100):
+    return ShowRecord.from_show(film, {"screenName": "AUDI 1", "showTime": time, "availableSeats": seats, "totalSeats": 120})
+
+
+def test_diff_reports_new_removed_and_changed():
+    snapshot = ShowSnapshot()
+    snapshot.diff([record("Leo"), record("Leo", "01:00 PM")])
+    new, removed, changed = snapshot.diff([record("Leo", seats=90), record("Jawan")])
+    assert [show.film for show in new] == ["Jawan"]
+    assert removed == [("Leo", "AUDI 1", "01:00 PM")]
+    assert changed == [("Leo", "AUDI 1", "10:00 AM")]
+
+
+def test_same_list_short_circuits():
+    snapshot = ShowSnapshot()
+    sessions = [record("Leo")]
+    snapshot.diff(sessions)
+    assert snapshot.diff(sessions) == ([], [], [])
+
+
+def test_widening_the_film_needles_is_not_a_change():
+    snapshot = ShowSnapshot(films=frozenset({"leo"}))
+    snapshot.diff([record("Leo")], frozenset({"leo"}))
+    new, removed, changed = snapshot.diff([record("Leo", seats=90), record("Jawan")], None)
+    assert (new, removed) == ([], [])
+    assert changed == [("Leo", "AUDI 1", "10:00 AM")]
+    assert set(snapshot.states) == {("Leo", "AUDI 1", "10:00 AM"), ("Jawan", "AUDI 1", "10:00 AM")}
+
+
+def test_narrowing_the_film_needles_is_not_a_change():
+    snapshot = ShowSnapshot()
+    snapshot.diff([record("Leo"), record("Jawan")])
+    assert snapshot.diff([record("Leo")], frozenset({"leo"})) == ([], [], [])
+    new, removed, _ = snapshot.diff([], frozenset({"leo"}))
+    assert removed == [("Leo", "AUDI 1", "10:00 AM")]